@@ -0,0 +1,12 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+
+class StageCheckpoint(SQLModel, table=True):
+    """A finished stage (or part of one) of a conversation, with what it produced"""
+
+    conversation_id: str = Field(primary_key=True)
+    stage: str = Field(primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.now)
+    payload: Optional[str] = None
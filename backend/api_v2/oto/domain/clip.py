@@ -22,12 +22,33 @@ class ClipData(BaseModel):
     comment: str
     captions: ClipCaptions
     audio: Optional[bytes] = None
+    # the source ranges the audio was cut from
+    ranges: Optional[list[tuple[float, float]]] = None
 
 
 class ClipDatas(RootModel[list[ClipData]]):
     pass
 
 
+class SentenceRange(BaseModel):
+    # numbered sentence lines of the transcript, both inclusive
+    first: int
+    last: int
+
+
+class TranscriptClip(BaseModel):
+    """A clip picked from the transcript, as ranges of sentence lines"""
+
+    title: str
+    description: str
+    comment: str
+    segments: list[SentenceRange]
+
+
+class TranscriptClips(RootModel[list[TranscriptClip]]):
+    pass
+
+
 class Clip(SQLModel, table=True):
     id: Optional[str] = Field(
         default_factory=lambda: str(uuid.uuid4()), primary_key=True
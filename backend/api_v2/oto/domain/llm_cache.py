@@ -0,0 +1,13 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+
+class LLMResponseCacheEntry(SQLModel, table=True):
+    """Cached LLM response, keyed by a hash of everything sent to the model"""
+
+    key: str = Field(primary_key=True)
+    model: str = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.now)
+    accessed_at: datetime = Field(default_factory=datetime.now, index=True)
+    expires_at: datetime = Field(index=True)
+    response_text: str
@@ -0,0 +1,10 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+
+class ProviderLimiterState(SQLModel, table=True):
+    """Token buckets and in-flight leases of one provider, shared by workers"""
+
+    provider: str = Field(primary_key=True)
+    updated_at: datetime = Field(default_factory=datetime.now)
+    state_dump: str = ""
@@ -1,5 +1,10 @@
+import struct
+import zlib
+from array import array
 from datetime import datetime
+from typing import Literal, Optional
 from pydantic import BaseModel, RootModel
+from sqlalchemy import Column, LargeBinary
 from sqlmodel import SQLModel, Field
 
 
@@ -13,12 +18,236 @@ class Captions(RootModel[list[Caption]]):
     pass
 
 
+CaptionGranularity = Literal["word", "sentence", "turn"]
+
+SENTENCE_ENDINGS = (".", "?", "!", "。", "？", "！")
+
+
+def seconds_to_timecode(seconds: float) -> str:
+    """
+    make seconds to HH:MM:SS
+    """
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = int(seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def seconds_to_precise_timecode(seconds: float) -> str:
+    """
+    make seconds to HH:MM:SS.mmm
+    """
+    minutes = int(seconds // 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}:{seconds % 60:06.3f}"
+
+
+def timecode_to_seconds(timecode: str) -> float:
+    """
+    HH:MM:SS or MM:SS, optionally with a fraction, to seconds
+    """
+    seconds = 0.0
+    for part in timecode.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class TranscriptColumns:
+    """
+    word level transcript stored as parallel arrays instead of one Caption per word.
+    packs into a small zlib compressed blob and expands into Captions on demand.
+    """
+
+    VERSION = 1
+    HEADER = struct.Struct("<BII")  # version, number of words, number of speakers
+
+    def __init__(
+        self,
+        starts: Optional[array] = None,
+        ends: Optional[array] = None,
+        speaker_indices: Optional[array] = None,
+        speakers: Optional[list[str]] = None,
+        words: Optional[list[str]] = None,
+    ):
+        self.starts = starts if starts is not None else array("f")
+        self.ends = ends if ends is not None else array("f")
+        self.speaker_indices = (
+            speaker_indices if speaker_indices is not None else array("H")
+        )
+        self.speakers = speakers if speakers is not None else []
+        self.words = words if words is not None else []
+        self._speaker_lookup = {speaker: i for i, speaker in enumerate(self.speakers)}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def append(self, word: str, start: float, end: float, speaker: str) -> None:
+        speaker_index = self._speaker_lookup.get(speaker)
+        if speaker_index is None:
+            speaker_index = len(self.speakers)
+            self.speakers.append(speaker)
+            self._speaker_lookup[speaker] = speaker_index
+        self.starts.append(start)
+        self.ends.append(end)
+        self.speaker_indices.append(speaker_index)
+        self.words.append(word)
+
+    def pack(self) -> bytes:
+        # text is joined with NUL, which never appears in a transcript
+        text = "\0".join(self.speakers + self.words).encode("utf-8")
+        payload = (
+            self.HEADER.pack(self.VERSION, len(self.words), len(self.speakers))
+            + self._little_endian(self.starts).tobytes()
+            + self._little_endian(self.ends).tobytes()
+            + self._little_endian(self.speaker_indices).tobytes()
+            + text
+        )
+        return zlib.compress(payload)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "TranscriptColumns":
+        payload = zlib.decompress(data)
+        version, word_count, speaker_count = cls.HEADER.unpack_from(payload)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported transcript columns version: {version}")
+
+        offset = cls.HEADER.size
+        starts, offset = cls._read_array("f", payload, offset, word_count)
+        ends, offset = cls._read_array("f", payload, offset, word_count)
+        speaker_indices, offset = cls._read_array("H", payload, offset, word_count)
+
+        text = payload[offset:].decode("utf-8")
+        strings = text.split("\0") if speaker_count + word_count else []
+        return cls(
+            starts=starts,
+            ends=ends,
+            speaker_indices=speaker_indices,
+            speakers=strings[:speaker_count],
+            words=strings[speaker_count:],
+        )
+
+    @classmethod
+    def from_captions(cls, captions: Captions) -> "TranscriptColumns":
+        """
+        per word captions, as stored in legacy rows, with whole second timings
+        """
+        columns = cls()
+        for caption in captions.root:
+            start, _, end = caption.timecode.partition("-")
+            columns.append(
+                caption.caption,
+                timecode_to_seconds(start),
+                timecode_to_seconds(end or start),
+                caption.speaker,
+            )
+        return columns
+
+    def to_captions(self, granularity: CaptionGranularity = "word") -> Captions:
+        if granularity == "word":
+            return Captions(
+                [
+                    Caption(
+                        timecode=seconds_to_timecode(self.starts[i])
+                        + "-"
+                        + seconds_to_timecode(self.ends[i]),
+                        speaker=self.speakers[self.speaker_indices[i]],
+                        caption=self.words[i],
+                    )
+                    for i in range(len(self.words))
+                ]
+            )
+
+        captions = []
+        for first, last in self._groups(granularity):
+            captions.append(
+                Caption(
+                    timecode=seconds_to_timecode(self.starts[first])
+                    + "-"
+                    + seconds_to_timecode(self.ends[last]),
+                    speaker=self.speakers[self.speaker_indices[first]],
+                    caption=self._join(self.words[first : last + 1]),
+                )
+            )
+        return Captions(captions)
+
+    def spans(self, granularity: CaptionGranularity) -> list[tuple[int, int]]:
+        """
+        index ranges (inclusive) of the words of each caption
+        """
+        if granularity == "word":
+            return [(i, i) for i in range(len(self.words))]
+        return self._groups(granularity)
+
+    def text(self, first: int, last: int) -> str:
+        return self._join(self.words[first : last + 1])
+
+    def text_of(self, indices: list[int]) -> str:
+        return self._join([self.words[i] for i in indices])
+
+    def _groups(self, granularity: CaptionGranularity) -> list[tuple[int, int]]:
+        """
+        index ranges (inclusive) of consecutive words sharing a speaker,
+        additionally cut at sentence endings for `sentence` granularity
+        """
+        groups = []
+        first = 0
+        for i in range(len(self.words)):
+            is_last = i == len(self.words) - 1
+            if (
+                is_last
+                or self.speaker_indices[i + 1] != self.speaker_indices[i]
+                or (
+                    granularity == "sentence"
+                    and self.words[i].rstrip().endswith(SENTENCE_ENDINGS)
+                )
+            ):
+                groups.append((first, i))
+                first = i + 1
+        return groups
+
+    def _join(self, words: list[str]) -> str:
+        # fireworks words may already carry their leading space
+        if any(word.startswith(" ") for word in words):
+            return "".join(words).strip()
+        return " ".join(word.strip() for word in words)
+
+    @staticmethod
+    def _little_endian(values: array) -> array:
+        if struct.pack("=H", 1) == struct.pack("<H", 1):
+            return values
+        swapped = array(values.typecode, values)
+        swapped.byteswap()
+        return swapped
+
+    @classmethod
+    def _read_array(
+        cls, typecode: str, payload: bytes, offset: int, count: int
+    ) -> tuple[array, int]:
+        values = array(typecode)
+        end = offset + values.itemsize * count
+        values.frombytes(payload[offset:end])
+        return cls._little_endian(values), end
+
+
 class Transcript(SQLModel, table=True):
     id: str = Field(primary_key=True)
     user_id: str = Field(index=True)
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
-    captions_dump: str  # json dump of captions
+    captions_dump: str = ""  # json dump of captions (legacy rows)
+    columns_dump: Optional[bytes] = Field(
+        default=None, sa_column=Column(LargeBinary, nullable=True)
+    )  # packed TranscriptColumns
+
+    def get_captions(self, granularity: CaptionGranularity = "word") -> Captions:
+        if self.columns_dump:
+            return TranscriptColumns.unpack(self.columns_dump).to_captions(
+                granularity
+            )
+        # legacy rows only have the per word json
+        captions = Captions.model_validate_json(self.captions_dump)
+        if granularity == "word":
+            return captions
+        return TranscriptColumns.from_captions(captions).to_captions(granularity)
 
 
 class TranscriptResponse(BaseModel):
@@ -0,0 +1,50 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+from sqlmodel import SQLModel, Field
+import uuid
+
+
+class UsageRecord(SQLModel, table=True):
+    """One provider call, for cost and latency accounting"""
+
+    id: Optional[str] = Field(
+        default_factory=lambda: str(uuid.uuid4()), primary_key=True
+    )
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    conversation_id: Optional[str] = Field(default=None, index=True)
+    stage: Optional[str] = Field(default=None, index=True)
+    provider: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    thoughts_tokens: int = 0
+    cached_tokens: int = 0
+    audio_seconds: float = 0
+    wall_seconds: float = 0
+    queue_wait_seconds: float = 0
+    response_cache_hit: bool = False
+    estimated_cost_usd: Optional[float] = None
+
+
+class LatencyHistogram(BaseModel):
+    count: int
+    p50: float
+    p95: float
+    p99: float
+    buckets: dict[str, int]  # upper bound in seconds -> calls at or below it
+
+
+class UsageSummary(BaseModel):
+    provider: str
+    stage: Optional[str]
+    model: str
+    calls: int
+    response_cache_hits: int
+    prompt_tokens: int
+    completion_tokens: int
+    thoughts_tokens: int
+    cached_tokens: int
+    estimated_cost_usd: float
+    latency: LatencyHistogram
+    queue_wait: LatencyHistogram
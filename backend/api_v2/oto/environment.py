@@ -19,6 +19,54 @@ class Settings(BaseSettings):
     openai_api_key: str
     solana_keypair: str
     solana_rpc_url: str
+    transcription_chunked: bool = False
+    transcription_chunk_seconds: float = 600
+    transcription_chunk_concurrency: int = 4
+    prompt_token_budget: int = 200000
+    fused_analysis: bool = False
+    async_analysis: bool = False
+    context_cache_ttl_minutes: int = 30
+    llm_response_cache_enabled: bool = True
+    llm_response_cache_ttl_hours: float = 24 * 7
+    llm_response_cache_max_entries: int = 10000
+    rate_limit_backend: str = "file"  # file, database or none
+    rate_limit_dir: str = "/tmp/oto-rate-limits"
+    provider_limits: dict[str, dict] = {}  # e.g. {"vertexai": {"max_in_flight": 4}}
+    flow_run_limit: int = 1  # flow runs a worker takes at once
+    conversation_concurrency: int = 1  # conversations processed at once
+    conversation_audio_budget_minutes: float = 240
+    conversation_max_wait_minutes: float = 10
+    priority_user_ids: list[str] = []
+    pipeline_executor: str = "prefect"  # prefect, or local to run in this process
+    local_pipeline_conversations: int = 2  # conversations the local executor runs
+    local_pipeline_workers: int = 16  # tasks the local executor runs at once
+    progress_poll_seconds: float = 5  # progress streams read the db when idle
+    scratch_dir: str = "/tmp/oto-scratch"  # local copies of source audio
+    scratch_quota_mb: int = 4096
+    scratch_parallel_min_mb: int = 32  # larger files download in ranged parts
+    scratch_part_mb: int = 8
+    scratch_download_workers: int = 8
+    clip_concurrency: int = 4  # clips cleaned, enhanced and uploaded at once
+    audio_enhancer_backend: str = "sieve"  # sieve, or local to skip enhancement
+    clip_intermediate_format: str = "flac"  # flac or opus, what clips are cut to
+    tts_concurrency: int = 8  # comments spoken at once
+    clip_selection: str = "audio"  # audio, or transcript to pick clips from text
+    clip_captions: str = "remap"  # remap from word timings, or gemini to listen
+    filler_words: list[str] = [
+        "えー",
+        "えーと",
+        "えっと",
+        "あー",
+        "あのー",
+        "うーん",
+        "んー",
+        "um",
+        "umm",
+        "uh",
+        "uhm",
+        "erm",
+        "hmm",
+    ]
 
 
 @lru_cache
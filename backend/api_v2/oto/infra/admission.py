@@ -0,0 +1,162 @@
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+from oto.environment import get_settings
+from oto.infra.rate_limit import get_limiter_backend
+
+# rough bitrates, only used to rank uploads before they are decoded
+BYTES_PER_SECOND: dict[str, int] = {
+    "audio/wav": 176_400,
+    "audio/x-wav": 176_400,
+    "audio/wave": 176_400,
+    "audio/flac": 88_200,
+    "audio/x-flac": 88_200,
+    "audio/mpeg": 16_000,
+    "audio/mp3": 16_000,
+    "audio/mp4": 16_000,
+    "audio/m4a": 16_000,
+    "audio/x-m4a": 16_000,
+    "audio/aac": 16_000,
+    "audio/ogg": 4_000,
+    "audio/opus": 4_000,
+    "audio/webm": 4_000,
+}
+DEFAULT_BYTES_PER_SECOND = 16_000
+
+
+def estimate_audio_minutes(file_size: int, mime_type: str) -> float:
+    bytes_per_second = BYTES_PER_SECOND.get(
+        mime_type.split(";")[0].strip().lower(), DEFAULT_BYTES_PER_SECOND
+    )
+    return file_size / bytes_per_second / 60
+
+
+@lru_cache
+def get_conversation_admission() -> "ConversationAdmission":
+    settings = get_settings()
+    return ConversationAdmission(
+        get_limiter_backend(),
+        concurrency=settings.conversation_concurrency,
+        audio_budget_minutes=settings.conversation_audio_budget_minutes,
+        max_wait_minutes=settings.conversation_max_wait_minutes,
+        priority_user_ids=settings.priority_user_ids,
+    )
+
+
+class Ticket:
+    def __init__(self, job_id: str, estimated_minutes: float, wait_seconds: float):
+        self.job_id = job_id
+        self.estimated_minutes = estimated_minutes
+        self.wait_seconds = wait_seconds
+
+
+class ConversationAdmission:
+    """
+    decides which waiting conversation is processed next, across every flow run
+    sharing the backend. at most `concurrency` run at once, holding at most
+    `audio_budget_minutes` of audio between them (a longer one runs alone).
+
+    the shortest audio goes first, `priority_user_ids` jump ahead, and every
+    minute spent waiting counts as a minute less of audio. a conversation waiting
+    longer than `max_wait_minutes` keeps everything behind it waiting until it fits.
+    """
+
+    STATE_KEY = "conversation_admission"
+    POLL_SECONDS = 2
+    HEARTBEAT_TIMEOUT_SECONDS = 60  # waiting runs that stopped polling are dropped
+    RUNNING_TTL_SECONDS = 60 * 60  # and running ones that never left
+    PRIORITY_BONUS_MINUTES = 60
+
+    def __init__(
+        self,
+        backend,
+        concurrency: int,
+        audio_budget_minutes: float,
+        max_wait_minutes: float,
+        priority_user_ids: list[str],
+    ):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.audio_budget_minutes = audio_budget_minutes
+        self.max_wait_seconds = max_wait_minutes * 60
+        self.priority_user_ids = set(priority_user_ids)
+
+    @contextmanager
+    def admit(
+        self, job_id: str, user_id: str, estimated_minutes: float
+    ) -> Iterator[Ticket]:
+        if self.backend is None:
+            yield Ticket(job_id, estimated_minutes, 0.0)
+            return
+
+        job = {
+            "minutes": estimated_minutes,
+            "priority": user_id in self.priority_user_ids,
+            "enqueued_at": time.time(),
+        }
+        started_at = time.monotonic()
+        try:
+            while not self._try_admit(job_id, job):
+                time.sleep(self.POLL_SECONDS)
+            yield Ticket(job_id, estimated_minutes, time.monotonic() - started_at)
+        finally:
+            self._leave(job_id)
+
+    def _try_admit(self, job_id: str, job: dict) -> bool:
+        with self.backend.transaction(self.STATE_KEY) as state:
+            now = time.time()
+            waiting: dict = state.setdefault("waiting", {})
+            running: dict = state.setdefault("running", {})
+            for stale in [k for k, v in running.items() if v["expires_at"] < now]:
+                del running[stale]
+            for stale in [
+                k
+                for k, v in waiting.items()
+                if v["seen_at"] < now - self.HEARTBEAT_TIMEOUT_SECONDS
+            ]:
+                del waiting[stale]
+            waiting[job_id] = {**job, "seen_at": now}
+
+            # hand out capacity in queue order, as the runs ahead will on their poll
+            slots = self.concurrency - len(running)
+            budget = self.audio_budget_minutes - sum(
+                v["minutes"] for v in running.values()
+            )
+            occupied = len(running)
+            queue = sorted(waiting.items(), key=lambda item: self._rank(item[1], now))
+            for other_id, other in queue:
+                fits = slots > 0 and (other["minutes"] <= budget or occupied == 0)
+                if other_id == job_id:
+                    if not fits:
+                        return False
+                    del waiting[job_id]
+                    running[job_id] = {
+                        "minutes": job["minutes"],
+                        "expires_at": now + self.RUNNING_TTL_SECONDS,
+                    }
+                    return True
+                if fits:
+                    slots -= 1
+                    budget -= other["minutes"]
+                    occupied += 1
+                elif self._starving(other, now):
+                    # nothing behind it may take what it is waiting for
+                    return False
+            return False
+
+    def _rank(self, job: dict, now: float) -> tuple[bool, float]:
+        if self._starving(job, now):
+            # oldest first
+            return False, job["enqueued_at"]
+        waited_minutes = (now - job["enqueued_at"]) / 60
+        bonus = self.PRIORITY_BONUS_MINUTES if job["priority"] else 0
+        return True, job["minutes"] - waited_minutes - bonus
+
+    def _starving(self, job: dict, now: float) -> bool:
+        return now - job["enqueued_at"] > self.max_wait_seconds
+
+    def _leave(self, job_id: str) -> None:
+        with self.backend.transaction(self.STATE_KEY) as state:
+            state.setdefault("waiting", {}).pop(job_id, None)
+            state.setdefault("running", {}).pop(job_id, None)
@@ -1,8 +1,14 @@
 from sqlmodel import SQLModel, create_engine, Session
 from typing import Generator
+from sqlalchemy import inspect, text
 from oto.environment import get_settings
 from oto.domain.clip import Clip
 from oto.domain.job import ConversationJob
+from oto.domain.llm_cache import LLMResponseCacheEntry
+from oto.domain.rate_limit import ProviderLimiterState
+from oto.domain.usage import UsageRecord
+from oto.domain.checkpoint import StageCheckpoint
+from oto.domain.transcript import Transcript
 
 DATABASE_URL = get_settings().database_url
 
@@ -18,6 +24,21 @@ engine = create_engine(
 def create_db_and_tables():
     """Create database tables"""
     SQLModel.metadata.create_all(engine)
+    migrate_columns()
+
+
+def migrate_columns():
+    """
+    create_all only creates missing tables, columns added to an existing table
+    are added here
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("transcript")}
+    if "columns_dump" not in columns:
+        binary = "BYTEA" if engine.dialect.name == "postgresql" else "BLOB"
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"ALTER TABLE transcript ADD COLUMN columns_dump {binary}")
+            )
 
 
 def get_db_session() -> Generator[Session, None, None]:
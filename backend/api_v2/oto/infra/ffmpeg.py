@@ -0,0 +1,111 @@
+import re
+import subprocess
+
+SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+MEAN_VOLUME = re.compile(r"mean_volume: (-?[\d.]+|-inf) dB")
+
+
+def run(command: list[str]) -> subprocess.CompletedProcess:
+    """
+    runs ffmpeg or ffprobe, raising with what it wrote to stderr when it fails
+    """
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace").strip()
+        raise Exception(
+            f"{command[0]} exited with {result.returncode}: {stderr[-2000:]}"
+        )
+    return result
+
+
+def probe_duration(path: str) -> float:
+    output = run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            path,
+        ]
+    ).stdout
+    return float(output.decode().strip())
+
+
+def mean_volume(path: str) -> float:
+    """
+    the mean loudness of the mono mix in dBFS, streamed rather than decoded whole
+    """
+    stderr = _analyze(path, "volumedetect")
+    match = MEAN_VOLUME.search(stderr)
+    if not match or match.group(1) == "-inf":
+        return float("-inf")
+    return float(match.group(1))
+
+
+def detect_silences(
+    path: str, threshold_db: float, min_silence_ms: int
+) -> list[tuple[float, float]]:
+    """
+    the pauses quieter than `threshold_db` for at least `min_silence_ms`, in seconds
+    """
+    stderr = _analyze(
+        path, f"silencedetect=noise={threshold_db:.2f}dB:d={min_silence_ms / 1000}"
+    )
+    silences: list[tuple[float, float]] = []
+    start = None
+    for line in stderr.splitlines():
+        if match := SILENCE_START.search(line):
+            start = max(float(match.group(1)), 0.0)
+        elif (match := SILENCE_END.search(line)) and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    if start is not None:
+        # silent until the end
+        silences.append((start, probe_duration(path)))
+    return silences
+
+
+def cut(path: str, start: float, end: float, format: str = "flac") -> bytes:
+    """
+    `start` to `end` of the file, seeking instead of decoding up to the start
+    """
+    return run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-ss",
+            f"{start:.3f}",
+            "-t",
+            f"{end - start:.3f}",
+            "-i",
+            path,
+            "-vn",
+            "-f",
+            format,
+            "pipe:1",
+        ]
+    ).stdout
+
+
+def _analyze(path: str, audio_filter: str) -> str:
+    return run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-nostats",
+            "-i",
+            path,
+            "-vn",
+            "-af",
+            f"aformat=channel_layouts=mono,{audio_filter}",
+            "-f",
+            "null",
+            "-",
+        ]
+    ).stderr.decode("utf-8", errors="replace")
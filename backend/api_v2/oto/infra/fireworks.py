@@ -1,3 +1,4 @@
+import time
 import requests
 from vertexai.generative_models import Part, GenerationConfig
 from oto.domain.transcript import Captions
@@ -5,38 +6,57 @@ from functools import lru_cache
 from oto.environment import get_settings
 from oto.infra.storage import get_storage
 from io import TextIOWrapper
+from typing import Optional
 from oto.domain.fireworks import FireworksTranscriptionResponse
+from oto.infra.rate_limit import ProviderLimiter, get_provider_limiter
+from oto.infra.usage import UsageLedger, get_usage_ledger
 
 
 @lru_cache
 def get_fireworks() -> "Fireworks":
     settings = get_settings()
-    return Fireworks(settings.fireworks_api_key)
+    return Fireworks(
+        settings.fireworks_api_key, get_provider_limiter(), get_usage_ledger()
+    )
 
 
 class Fireworks:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, limiter: ProviderLimiter, ledger: UsageLedger):
         self.api_key = api_key
+        self.limiter = limiter
+        self.ledger = ledger
 
-    def transcribe(self, f: TextIOWrapper) -> FireworksTranscriptionResponse:
-        response = requests.post(
-            "https://audio-prod.us-virginia-1.direct.fireworks.ai/v1/audio/transcriptions",
-            headers={"Authorization": f"Bearer {self.api_key}"},
-            files={"file": f},
-            data={
-                "vad_model": "whisperx-pyannet",
-                "alignment_model": "mms_fa",
-                "preprocessing": "bass_dynamic",
-                "temperature": "0.2",
-                "timestamp_granularities": "word,segment",
-                "audio_window_seconds": "5",
-                "speculation_window_words": "4",
-                "diarize": "true",
-                "response_format": "verbose_json",
-            },
-        )
+    def transcribe(
+        self, f: TextIOWrapper, file_name: Optional[str] = None
+    ) -> FireworksTranscriptionResponse:
+        started_at = time.monotonic()
+        with self.limiter.acquire("fireworks") as lease:
+            response = requests.post(
+                "https://audio-prod.us-virginia-1.direct.fireworks.ai/v1/audio/transcriptions",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                files={"file": (file_name, f) if file_name else f},
+                data={
+                    "vad_model": "whisperx-pyannet",
+                    "alignment_model": "mms_fa",
+                    "preprocessing": "bass_dynamic",
+                    "temperature": "0.2",
+                    "timestamp_granularities": "word,segment",
+                    "audio_window_seconds": "5",
+                    "speculation_window_words": "4",
+                    "diarize": "true",
+                    "response_format": "verbose_json",
+                },
+            )
 
         if response.status_code == 200:
-            return FireworksTranscriptionResponse.model_validate_json(response.text)
+            result = FireworksTranscriptionResponse.model_validate_json(response.text)
+            self.ledger.record(
+                provider="fireworks",
+                model="whisper-v3",
+                wall_seconds=time.monotonic() - started_at,
+                audio_seconds=result.duration,
+                queue_wait_seconds=lease.wait_seconds,
+            )
+            return result
         else:
             raise Exception(f"Error: {response.status_code}", response.text)
@@ -1,3 +1,4 @@
+from datetime import datetime
 from functools import lru_cache
 from prefect import get_client
 from sqlmodel import select
@@ -17,15 +18,22 @@ class PrefectJobManager:
     def put_job(
         self, job_type: str, flow_run_id: str, conversation_id: str, user_id: str
     ):
+        """
+        an existing job is pointed at the new flow run, e.g. when it is resumed
+        """
         with create_db_session() as session:
-            session.add(
-                ConversationJob(
+            job = session.get(ConversationJob, (conversation_id, job_type))
+            if job:
+                job.flow_run_id = str(flow_run_id)
+                job.updated_at = datetime.now()
+            else:
+                job = ConversationJob(
                     job_type=job_type,
                     flow_run_id=str(flow_run_id),
                     conversation_id=conversation_id,
                     user_id=user_id,
                 )
-            )
+            session.add(job)
             session.commit()
 
     def get_job(self, job_type: str, conversation_id: str) -> ConversationJob | None:
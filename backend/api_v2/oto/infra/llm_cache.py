@@ -0,0 +1,124 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Optional
+from sqlmodel import select, delete, func
+from oto.environment import get_settings
+from oto.infra.database import create_db_session
+from oto.domain.llm_cache import LLMResponseCacheEntry
+
+
+@lru_cache
+def get_llm_response_cache() -> "LLMResponseCache":
+    settings = get_settings()
+    return LLMResponseCache(
+        enabled=settings.llm_response_cache_enabled,
+        ttl_hours=settings.llm_response_cache_ttl_hours,
+        max_entries=settings.llm_response_cache_max_entries,
+    )
+
+
+class LLMResponseCache:
+    """
+    persistent cache of LLM response texts in the database, so re-running a flow
+    with the same model, prompt, schema and inputs does not pay for the call again.
+    entries expire after the ttl and the least recently used ones are evicted
+    once there are more than `max_entries`. callers opt in per call, see
+    VertexAI.generate_content.
+    """
+
+    # accessed_at is only rewritten once it is this stale
+    ACCESS_RESOLUTION = timedelta(hours=1)
+    # expired and least recently used entries are evicted every this many puts
+    EVICT_EVERY_PUTS = 100
+
+    def __init__(self, enabled: bool, ttl_hours: float, max_entries: int):
+        self.enabled = enabled
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def key(self, model_name: str, *inputs: Any) -> str:
+        digest = hashlib.sha256(model_name.encode("utf-8"))
+        for value in inputs:
+            digest.update(b"\0")
+            digest.update(
+                json.dumps(
+                    self._to_jsonable(value), sort_keys=True, ensure_ascii=False
+                ).encode("utf-8")
+            )
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with create_db_session() as session:
+            entry = session.get(LLMResponseCacheEntry, key)
+            if not entry:
+                return None
+            now = datetime.now()
+            if entry.expires_at < now:
+                session.delete(entry)
+                session.commit()
+                return None
+            if now - entry.accessed_at > self.ACCESS_RESOLUTION:
+                # close enough for lru, most hits write nothing
+                entry.accessed_at = now
+                session.add(entry)
+                session.commit()
+            return entry.response_text
+
+    def put(self, key: str, model_name: str, response_text: str) -> None:
+        if not self.enabled:
+            return
+        now = datetime.now()
+        with create_db_session() as session:
+            session.merge(
+                LLMResponseCacheEntry(
+                    key=key,
+                    model=model_name,
+                    created_at=now,
+                    accessed_at=now,
+                    expires_at=now + self.ttl,
+                    response_text=response_text,
+                )
+            )
+            session.commit()
+            with self._lock:
+                self._puts += 1
+                evict = self._puts % self.EVICT_EVERY_PUTS == 1
+            if evict:
+                self._evict(session, now)
+
+    def _evict(self, session, now: datetime) -> None:
+        session.exec(
+            delete(LLMResponseCacheEntry).where(LLMResponseCacheEntry.expires_at < now)
+        )
+        count = session.exec(select(func.count(LLMResponseCacheEntry.key))).one()
+        if count > self.max_entries:
+            oldest = session.exec(
+                select(LLMResponseCacheEntry.key)
+                .order_by(LLMResponseCacheEntry.accessed_at)
+                .limit(count - self.max_entries)
+            ).all()
+            session.exec(
+                delete(LLMResponseCacheEntry).where(
+                    LLMResponseCacheEntry.key.in_(oldest)
+                )
+            )
+        session.commit()
+
+    def _to_jsonable(self, value: Any) -> Any:
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self._to_jsonable(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): self._to_jsonable(v) for k, v in value.items()}
+        if hasattr(value, "to_dict"):
+            # Part, GenerationConfig, SafetySetting
+            return value.to_dict()
+        return repr(value)
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+
+
+@lru_cache
+def get_progress_hub() -> "ProgressHub":
+    return ProgressHub()
+
+
+class ProgressHub:
+    """
+    in-process pub/sub of conversation progress. tasks publish from any thread,
+    subscribers read from an asyncio queue on their own event loop.
+    only reaches subscribers of the same process, e.g. with the local pipeline
+    executor; a prefect worker publishes to nobody.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: dict[
+            str, list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]
+        ] = {}
+
+    def publish(self, conversation_id: str, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(conversation_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # the loop closed before the subscriber left
+                pass
+
+    def publish_status(
+        self, conversation_id: str, status: str, inner_status: str
+    ) -> None:
+        self.publish(
+            conversation_id,
+            {"type": "status", "status": status, "inner_status": inner_status},
+        )
+
+    def publish_section(self, conversation_id: str, section: str) -> None:
+        """
+        an analysis section is done, it is stored when the analysis completes
+        """
+        self.publish(conversation_id, {"type": "section", "section": section})
+
+    @contextmanager
+    def subscribe(self, conversation_id: str) -> Iterator[asyncio.Queue]:
+        """
+        must be entered on the event loop that reads the queue
+        """
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(conversation_id, []).append(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers[conversation_id]
+                subscribers.remove(entry)
+                if not subscribers:
+                    del self._subscribers[conversation_id]
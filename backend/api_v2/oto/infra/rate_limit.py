@@ -0,0 +1,271 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, Optional
+from pydantic import BaseModel
+from sqlmodel import select
+from sqlalchemy.exc import IntegrityError
+from oto.environment import get_settings
+from oto.infra.database import create_db_session
+from oto.domain.rate_limit import ProviderLimiterState
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderLimits(BaseModel):
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    max_in_flight: Optional[int] = None
+
+
+DEFAULT_PROVIDER_LIMITS: dict[str, ProviderLimits] = {
+    "vertexai": ProviderLimits(
+        requests_per_minute=120, tokens_per_minute=2_000_000, max_in_flight=16
+    ),
+    "fireworks": ProviderLimits(requests_per_minute=60, max_in_flight=8),
+    "sieve": ProviderLimits(requests_per_minute=30, max_in_flight=8),
+    "openai_tts": ProviderLimits(requests_per_minute=60, max_in_flight=8),
+}
+
+
+@lru_cache
+def get_provider_limiter() -> "ProviderLimiter":
+    settings = get_settings()
+    limits = dict(DEFAULT_PROVIDER_LIMITS)
+    for provider, override in settings.provider_limits.items():
+        limits[provider] = ProviderLimits.model_validate(override)
+
+    return ProviderLimiter(limits, get_limiter_backend())
+
+
+def get_limiter_backend():
+    """
+    where state shared by the workers is kept, None when nothing is shared
+    """
+    settings = get_settings()
+    if settings.rate_limit_backend == "database":
+        return DatabaseLimiterBackend()
+    elif settings.rate_limit_backend == "file":
+        return FileLimiterBackend(settings.rate_limit_dir)
+    return None
+
+
+class FileLimiterBackend:
+    """
+    keeps each provider's state in a json file guarded by flock,
+    shared by every worker process on the same machine
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def transaction(self, provider: str) -> Iterator[dict]:
+        path = os.path.join(self.directory, f"{provider}.json")
+        with open(path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class DatabaseLimiterBackend:
+    """
+    keeps each provider's state in a row locked with SELECT ... FOR UPDATE,
+    shared by every worker process using the same database
+    """
+
+    @contextmanager
+    def transaction(self, provider: str) -> Iterator[dict]:
+        with create_db_session() as session:
+            row = self._lock_row(session, provider)
+            state = json.loads(row.state_dump) if row.state_dump else {}
+            yield state
+            row.state_dump = json.dumps(state)
+            row.updated_at = datetime.now()
+            session.add(row)
+            session.commit()
+
+    def _lock_row(self, session, provider: str) -> ProviderLimiterState:
+        query = (
+            select(ProviderLimiterState)
+            .where(ProviderLimiterState.provider == provider)
+            .with_for_update()
+        )
+        row = session.exec(query).first()
+        if row:
+            return row
+        try:
+            session.add(ProviderLimiterState(provider=provider, state_dump=""))
+            session.commit()
+        except IntegrityError:
+            # another worker created it first
+            session.rollback()
+        return session.exec(query).one()
+
+
+class Lease:
+    def __init__(
+        self, provider: str, lease_id: str, tokens: int, wait_seconds: float
+    ):
+        self.provider = provider
+        self.lease_id = lease_id
+        self.tokens = tokens
+        self.wait_seconds = wait_seconds
+        self.actual_tokens: Optional[int] = None
+
+    def report_tokens(self, tokens: int) -> None:
+        self.actual_tokens = tokens
+
+
+class ProviderLimiter:
+    """
+    admission control per provider: a requests bucket and a tokens bucket, both
+    refilled continuously up to one minute worth, plus a cap on requests in flight.
+    callers block in `acquire` until all three admit the request.
+    """
+
+    LEASE_TTL_SECONDS = 30 * 60  # leases of crashed workers are dropped after this
+    POLL_SECONDS = 0.25
+
+    def __init__(self, limits: dict[str, ProviderLimits], backend):
+        self.limits = limits
+        self.backend = backend
+        self._stats_lock = threading.Lock()
+        # recent queue waits per provider
+        self.wait_seconds: dict[str, deque[float]] = {}
+
+    @contextmanager
+    def acquire(self, provider: str, tokens: int = 0) -> Iterator[Lease]:
+        limits = self.limits.get(provider)
+        if self.backend is None or limits is None:
+            yield Lease(provider, "", tokens, 0.0)
+            return
+
+        lease_id = uuid.uuid4().hex
+        started_at = time.monotonic()
+        while True:
+            wait = self._try_acquire(provider, limits, lease_id, tokens)
+            if wait <= 0:
+                break
+            time.sleep(min(wait, self.POLL_SECONDS))
+        lease = Lease(provider, lease_id, tokens, time.monotonic() - started_at)
+        self._record_wait(provider, lease.wait_seconds)
+
+        try:
+            yield lease
+        finally:
+            self._release(provider, limits, lease)
+
+    @asynccontextmanager
+    async def acquire_async(
+        self, provider: str, tokens: int = 0
+    ) -> AsyncIterator[Lease]:
+        limits = self.limits.get(provider)
+        if self.backend is None or limits is None:
+            yield Lease(provider, "", tokens, 0.0)
+            return
+
+        lease_id = uuid.uuid4().hex
+        started_at = time.monotonic()
+        while True:
+            wait = await asyncio.to_thread(
+                self._try_acquire, provider, limits, lease_id, tokens
+            )
+            if wait <= 0:
+                break
+            await asyncio.sleep(min(wait, self.POLL_SECONDS))
+        lease = Lease(provider, lease_id, tokens, time.monotonic() - started_at)
+        self._record_wait(provider, lease.wait_seconds)
+
+        try:
+            yield lease
+        finally:
+            await asyncio.to_thread(self._release, provider, limits, lease)
+
+    def _try_acquire(
+        self, provider: str, limits: ProviderLimits, lease_id: str, tokens: int
+    ) -> float:
+        """
+        returns 0 when admitted, otherwise seconds until it may be
+        """
+        with self.backend.transaction(provider) as state:
+            now = time.time()
+            self._refill(state, limits, now)
+            in_flight: dict = state.setdefault("in_flight", {})
+            for stale in [k for k, v in in_flight.items() if v < now]:
+                del in_flight[stale]
+
+            waits = [0.0]
+            if limits.max_in_flight and len(in_flight) >= limits.max_in_flight:
+                waits.append(self.POLL_SECONDS)
+            if limits.requests_per_minute and state["requests"] < 1:
+                waits.append(
+                    (1 - state["requests"]) * 60 / limits.requests_per_minute
+                )
+            if limits.tokens_per_minute and tokens:
+                needed = min(tokens, limits.tokens_per_minute)
+                if state["tokens"] < needed:
+                    waits.append(
+                        (needed - state["tokens"]) * 60 / limits.tokens_per_minute
+                    )
+            wait = max(waits)
+            if wait > 0:
+                return wait
+
+            if limits.requests_per_minute:
+                state["requests"] -= 1
+            if limits.tokens_per_minute:
+                state["tokens"] -= tokens
+            in_flight[lease_id] = now + self.LEASE_TTL_SECONDS
+            return 0
+
+    def _release(self, provider: str, limits: ProviderLimits, lease: Lease) -> None:
+        with self.backend.transaction(provider) as state:
+            self._refill(state, limits, time.time())
+            state.setdefault("in_flight", {}).pop(lease.lease_id, None)
+            if limits.tokens_per_minute and lease.actual_tokens is not None:
+                # settle the estimate against what the provider actually counted
+                state["tokens"] -= lease.actual_tokens - lease.tokens
+
+    def _refill(self, state: dict, limits: ProviderLimits, now: float) -> None:
+        elapsed = max(0.0, now - state.get("updated_at", now))
+        state["updated_at"] = now
+        if limits.requests_per_minute:
+            state["requests"] = min(
+                limits.requests_per_minute,
+                state.get("requests", limits.requests_per_minute)
+                + elapsed * limits.requests_per_minute / 60,
+            )
+        if limits.tokens_per_minute:
+            state["tokens"] = min(
+                limits.tokens_per_minute,
+                state.get("tokens", limits.tokens_per_minute)
+                + elapsed * limits.tokens_per_minute / 60,
+            )
+
+    def _record_wait(self, provider: str, wait_seconds: float) -> None:
+        with self._stats_lock:
+            self.wait_seconds.setdefault(provider, deque(maxlen=1024)).append(
+                wait_seconds
+            )
+        if wait_seconds >= 1:
+            logger.debug("%s queue wait: %.2fs", provider, wait_seconds)
@@ -0,0 +1,192 @@
+import hashlib
+import mmap
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from io import BytesIO
+from typing import BinaryIO, Iterator
+from fastapi import HTTPException
+from oto.environment import get_settings
+from oto.infra.storage import GoogleCloudStorage, get_storage
+
+MB = 1024 * 1024
+
+
+@lru_cache
+def get_scratch_cache() -> "ScratchCache":
+    settings = get_settings()
+    return ScratchCache(
+        get_storage(),
+        directory=settings.scratch_dir,
+        quota_bytes=settings.scratch_quota_mb * MB,
+        parallel_min_bytes=settings.scratch_parallel_min_mb * MB,
+        part_bytes=settings.scratch_part_mb * MB,
+        download_workers=settings.scratch_download_workers,
+    )
+
+
+class ScratchCache:
+    """
+    local copies of stored files, so the stages of a conversation download its
+    audio once instead of streaming it each. files held by a running flow stay,
+    the others are evicted least recently used first once over `quota_bytes`.
+    """
+
+    def __init__(
+        self,
+        storage: GoogleCloudStorage,
+        directory: str,
+        quota_bytes: int,
+        parallel_min_bytes: int,
+        part_bytes: int,
+        download_workers: int,
+    ):
+        self.storage = storage
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.parallel_min_bytes = parallel_min_bytes
+        self.part_bytes = part_bytes
+        self.download_workers = download_workers
+        self._lock = threading.Lock()
+        # local path -> download lock and the fetches using it
+        self._downloads: dict[str, list] = {}
+        self._held: dict[str, int] = {}
+        # local path -> size, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._index()
+
+    # partial downloads untouched this long were left by a process that died
+    STALE_PART_SECONDS = 24 * 60 * 60
+
+    def _index(self) -> None:
+        # copies left by an earlier process of this worker
+        paths = [os.path.join(self.directory, n) for n in os.listdir(self.directory)]
+        for path in [p for p in paths if p.endswith(".part")]:
+            paths.remove(path)
+            try:
+                # other processes may be downloading into theirs right now
+                if time.time() - os.path.getmtime(path) > self.STALE_PART_SECONDS:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        for path in sorted(paths, key=os.path.getmtime):
+            self._entries[path] = os.path.getsize(path)
+
+    def local_path(self, filename: str) -> str:
+        key = hashlib.sha256(filename.encode()).hexdigest()
+        ext = os.path.splitext(filename)[1]
+        return os.path.join(self.directory, f"{key}{ext}")
+
+    @contextmanager
+    def fetch(self, filename: str) -> Iterator[str]:
+        """
+        the local path of the file, downloaded on first use. the file is held
+        until the block exits, so it is not evicted while the caller reads it.
+        """
+        with self.hold(filename):
+            yield self._fetch(filename)
+
+    def _fetch(self, filename: str) -> str:
+        # concurrent callers wait for one download instead of starting their own
+        path = self.local_path(filename)
+        with self._lock:
+            download = self._downloads.setdefault(path, [threading.Lock(), 0])
+            download[1] += 1
+        try:
+            with download[0]:
+                with self._lock:
+                    if path in self._entries:
+                        self._entries.move_to_end(path)
+                        return path
+                size = self._download(filename, path)
+                with self._lock:
+                    self._entries[path] = size
+        finally:
+            with self._lock:
+                # only fetches in progress keep their lock
+                download[1] -= 1
+                if not download[1]:
+                    del self._downloads[path]
+        self.evict()
+        return path
+
+    def _download(self, filename: str, path: str) -> int:
+        blob = self.storage.bucket.get_blob(filename)
+        if not blob:
+            raise HTTPException(status_code=404, detail="File not found")
+        # unique to this download, another process may fetch the same file
+        partial = f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.part"
+        try:
+            if blob.size < self.parallel_min_bytes:
+                blob.download_to_filename(partial)
+            else:
+                self._download_parts(blob, partial)
+            # readers never see a partial file
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return blob.size
+
+    def _download_parts(self, blob, partial: str) -> None:
+        with open(partial, "wb") as f:
+            f.truncate(blob.size)
+
+        def download_part(start: int) -> None:
+            end = min(start + self.part_bytes, blob.size) - 1
+            data = blob.download_as_bytes(start=start, end=end)
+            with open(partial, "r+b") as f:
+                f.seek(start)
+                f.write(data)
+
+        with ThreadPoolExecutor(self.download_workers) as pool:
+            list(pool.map(download_part, range(0, blob.size, self.part_bytes)))
+
+    def open(self, filename: str) -> BinaryIO:
+        """
+        a memory-mapped reader of the local copy, close it when done
+        """
+        with self.fetch(filename) as path, open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return BytesIO()
+            # stays valid when the file is evicted while being read
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @contextmanager
+    def hold(self, filename: str) -> Iterator[None]:
+        """
+        keeps the file from being evicted until the block exits,
+        e.g. for the whole of a flow run
+        """
+        path = self.local_path(filename)
+        with self._lock:
+            self._held[path] = self._held.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._held[path] -= 1
+                if not self._held[path]:
+                    del self._held[path]
+            self.evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            total = sum(self._entries.values())
+            for path in list(self._entries):
+                if total <= self.quota_bytes:
+                    break
+                if path in self._held:
+                    continue
+                total -= self._entries.pop(path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -81,6 +81,12 @@ class GoogleCloudStorage:
                 status_code=500, detail=f"Signed URL generation failed: {str(e)}"
             )
 
+    def get_size(self, filename: str) -> int:
+        blob = self.bucket.get_blob(filename)
+        if not blob:
+            raise HTTPException(status_code=404, detail="File not found")
+        return blob.size
+
     def _generate_unique_filename(self, ext: str, folder_path: str = "") -> str:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         unique_id = uuid.uuid4().hex[:8]
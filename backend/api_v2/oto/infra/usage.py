@@ -0,0 +1,204 @@
+import logging
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterator, Optional
+from sqlmodel import case, col, func, select
+from oto.infra.database import create_db_session
+from oto.domain.conversation import Conversation
+from oto.domain.usage import UsageRecord, UsageSummary, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+_conversation_id: ContextVar[Optional[str]] = ContextVar(
+    "usage_conversation_id", default=None
+)
+_stage: ContextVar[Optional[str]] = ContextVar("usage_stage", default=None)
+
+# USD per million tokens: input, output (including thinking), cached input
+TOKEN_PRICES: dict[str, tuple[float, float, float]] = {
+    "gemini-2.5-flash": (0.30, 2.50, 0.075),
+    "gemini-2.5-pro": (1.25, 10.00, 0.31),
+}
+# USD per audio minute
+AUDIO_MINUTE_PRICES: dict[str, float] = {
+    "whisper-v3": 0.0015,
+}
+
+HISTOGRAM_BOUNDS = [0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600]
+
+
+@lru_cache
+def get_usage_ledger() -> "UsageLedger":
+    return UsageLedger()
+
+
+@contextmanager
+def usage_stage(stage: str, conversation_id: Optional[str] = None) -> Iterator[None]:
+    """
+    attributes every provider call made inside the block to this stage
+    (and conversation). contextvars follow asyncio tasks and to_thread,
+    plain thread pools need contextvars.copy_context().
+    """
+    stage_token = _stage.set(stage)
+    conversation_token = (
+        _conversation_id.set(conversation_id) if conversation_id else None
+    )
+    try:
+        yield
+    finally:
+        _stage.reset(stage_token)
+        if conversation_token:
+            _conversation_id.reset(conversation_token)
+
+
+class UsageLedger:
+    def record(
+        self,
+        provider: str,
+        model: str,
+        wall_seconds: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        thoughts_tokens: int = 0,
+        cached_tokens: int = 0,
+        audio_seconds: float = 0,
+        queue_wait_seconds: float = 0,
+        response_cache_hit: bool = False,
+    ) -> UsageRecord:
+        record = UsageRecord(
+            conversation_id=_conversation_id.get(),
+            stage=_stage.get(),
+            provider=provider,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            thoughts_tokens=thoughts_tokens,
+            cached_tokens=cached_tokens,
+            audio_seconds=audio_seconds,
+            wall_seconds=wall_seconds,
+            queue_wait_seconds=queue_wait_seconds,
+            response_cache_hit=response_cache_hit,
+        )
+        record.estimated_cost_usd = self.estimate_cost(record)
+        try:
+            with create_db_session() as session:
+                session.add(record)
+                session.commit()
+                session.refresh(record)
+        except Exception as e:
+            # accounting must never fail the call it accounts for
+            logger.warning("Failed to record usage: %s", e)
+        return record
+
+    def estimate_cost(self, record: UsageRecord) -> Optional[float]:
+        if record.response_cache_hit:
+            return 0.0
+        model = record.model.split("/")[-1]
+        if model in TOKEN_PRICES:
+            input_price, output_price, cached_price = TOKEN_PRICES[model]
+            uncached = max(0, record.prompt_tokens - record.cached_tokens)
+            return (
+                uncached * input_price
+                + record.cached_tokens * cached_price
+                + (record.completion_tokens + record.thoughts_tokens) * output_price
+            ) / 1_000_000
+        if model in AUDIO_MINUTE_PRICES:
+            return record.audio_seconds / 60 * AUDIO_MINUTE_PRICES[model]
+        return None
+
+    def summarize(
+        self,
+        since: datetime,
+        conversation_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> list[UsageSummary]:
+        """
+        aggregated in the database, one row per provider, stage and model.
+        percentiles are read off the histogram buckets.
+        """
+        columns = [
+            func.count(),
+            func.sum(case((col(UsageRecord.response_cache_hit), 1), else_=0)),
+            func.sum(UsageRecord.prompt_tokens),
+            func.sum(UsageRecord.completion_tokens),
+            func.sum(UsageRecord.thoughts_tokens),
+            func.sum(UsageRecord.cached_tokens),
+            func.coalesce(func.sum(UsageRecord.estimated_cost_usd), 0.0),
+        ]
+        for seconds in (UsageRecord.wall_seconds, UsageRecord.queue_wait_seconds):
+            columns += [
+                func.sum(case((seconds <= bound, 1), else_=0))
+                for bound in HISTOGRAM_BOUNDS
+            ]
+            columns.append(func.max(seconds))
+        group = (UsageRecord.provider, UsageRecord.stage, UsageRecord.model)
+        query = select(*group, *columns).where(UsageRecord.created_at >= since)
+        if conversation_id:
+            query = query.where(UsageRecord.conversation_id == conversation_id)
+        if user_id:
+            query = query.join(
+                Conversation, Conversation.id == UsageRecord.conversation_id
+            ).where(Conversation.user_id == user_id)
+        with create_db_session() as session:
+            rows = session.exec(query.group_by(*group)).all()
+
+        summaries = []
+        width = len(HISTOGRAM_BOUNDS) + 1
+        for row in rows:
+            provider, stage, model, calls = row[:4]
+            hits, prompt, completion, thoughts, cached, cost = [
+                value or 0 for value in row[4:10]
+            ]
+            latency = row[10 : 10 + width]
+            queue_wait = row[10 + width : 10 + 2 * width]
+            summaries.append(
+                UsageSummary(
+                    provider=provider,
+                    stage=stage,
+                    model=model,
+                    calls=calls,
+                    response_cache_hits=hits,
+                    prompt_tokens=prompt,
+                    completion_tokens=completion,
+                    thoughts_tokens=thoughts,
+                    cached_tokens=cached,
+                    estimated_cost_usd=cost,
+                    latency=self._histogram(calls, latency[:-1], latency[-1]),
+                    queue_wait=self._histogram(
+                        calls, queue_wait[:-1], queue_wait[-1]
+                    ),
+                )
+            )
+        summaries.sort(key=lambda s: s.estimated_cost_usd, reverse=True)
+        return summaries
+
+    def _histogram(
+        self, count: int, cumulative: list[Optional[int]], maximum: Optional[float]
+    ) -> LatencyHistogram:
+        buckets = {
+            str(bound): value or 0 for bound, value in zip(HISTOGRAM_BOUNDS, cumulative)
+        }
+        buckets["+Inf"] = count
+        return LatencyHistogram(
+            count=count,
+            p50=self._percentile(buckets, 50, maximum),
+            p95=self._percentile(buckets, 95, maximum),
+            p99=self._percentile(buckets, 99, maximum),
+            buckets=buckets,
+        )
+
+    def _percentile(
+        self, buckets: dict[str, int], percentile: float, maximum: Optional[float]
+    ) -> float:
+        # the upper bound of the bucket holding the nearest rank
+        count = buckets["+Inf"]
+        if not count:
+            return 0.0
+        rank = max(1, math.ceil(percentile / 100 * count))
+        for bound in HISTOGRAM_BOUNDS:
+            if buckets[str(bound)] >= rank:
+                return min(float(bound), maximum or float(bound))
+        return maximum or 0.0
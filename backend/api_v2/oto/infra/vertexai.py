@@ -1,11 +1,31 @@
 import json
+import asyncio
+import hashlib
+import logging
+import threading
+import time
 import vertexai
-from vertexai.generative_models import GenerativeModel, GenerationResponse
+from concurrent.futures import Future
+from datetime import timedelta
+from typing import Optional
+from vertexai.generative_models import (
+    GenerativeModel,
+    GenerationResponse,
+    GenerationConfig,
+    SafetySetting,
+    Part,
+)
+from vertexai.preview import caching
 from vertexai.language_models import TextEmbeddingModel, TextEmbeddingInput
 from google.oauth2 import service_account
 from functools import lru_cache
 
 from oto.environment import get_settings
+from oto.infra.llm_cache import LLMResponseCache, get_llm_response_cache
+from oto.infra.rate_limit import ProviderLimiter, get_provider_limiter
+from oto.infra.usage import UsageLedger, get_usage_ledger
+
+logger = logging.getLogger(__name__)
 
 
 @lru_cache
@@ -14,6 +34,10 @@ def get_vertexai() -> "VertexAI":
     return VertexAI(
         credentials_path=settings.google_cloud_credential_path,
         region=settings.google_cloud_region,
+        context_cache_ttl_minutes=settings.context_cache_ttl_minutes,
+        response_cache=get_llm_response_cache(),
+        limiter=get_provider_limiter(),
+        ledger=get_usage_ledger(),
     )
 
 
@@ -32,7 +56,17 @@ class Tokens:
 
 
 class VertexAI:
-    def __init__(self, credentials_path: str, region: str):
+    MEDIA_PART_TOKEN_ESTIMATE = 10000  # audio parts, before the real count is known
+
+    def __init__(
+        self,
+        credentials_path: str,
+        region: str,
+        context_cache_ttl_minutes: int = 30,
+        response_cache: Optional[LLMResponseCache] = None,
+        limiter: Optional[ProviderLimiter] = None,
+        ledger: Optional[UsageLedger] = None,
+    ):
         self.credentials = service_account.Credentials.from_service_account_file(
             credentials_path
         )
@@ -46,14 +80,269 @@ class VertexAI:
         self.embed = TextEmbeddingModel.from_pretrained(
             "text-multilingual-embedding-002"
         )
+        self.context_cache_ttl = timedelta(minutes=context_cache_ttl_minutes)
+        # scope -> (model name, contents hash) -> future of the cached content,
+        # None if not cacheable. the lock only guards the map, never a creation
+        self._cached_contents: dict[str, dict[tuple[str, str], Future]] = {}
+        self._cache_lock = threading.Lock()
+        self.response_cache = response_cache
+        self.limiter = limiter or ProviderLimiter({}, None)
+        self.ledger = ledger or UsageLedger()
+
+    def generate_content(
+        self,
+        model: GenerativeModel,
+        contents: list,
+        generation_config: Optional[GenerationConfig] = None,
+        safety_settings: Optional[list[SafetySetting]] = None,
+        context: Optional[list[Part]] = None,
+        cache_scope: Optional[str] = None,
+        cache_response: bool = False,
+    ) -> GenerationResponse:
+        """
+        `context` is the leading part of the prompt that other calls share
+        (the transcript or the audio), it is sent through the context cache
+        of `cache_scope`. with `cache_response`, identical requests are answered
+        from the response cache, only for deterministic calls (temperature 0),
+        so sampled outputs are never replayed on a reprocess.
+        """
+        context = context or []
+        started_at = time.monotonic()
+        key, cached = self._lookup_response(
+            model, context, contents, generation_config, safety_settings, cache_response
+        )
+        if cached is not None:
+            self.notify_cache_hit(model, time.monotonic() - started_at)
+            return cached
+
+        bound_model, prefix = self._with_cached_context(model, context, cache_scope)
+        with self.limiter.acquire(
+            "vertexai", self._estimate_tokens(context + contents)
+        ) as lease:
+            response = bound_model.generate_content(
+                prefix + contents,
+                generation_config=generation_config,
+                safety_settings=safety_settings,
+            )
+            lease.report_tokens(response.usage_metadata.total_token_count)
+        self.notify_response(
+            response, bound_model, time.monotonic() - started_at, lease.wait_seconds
+        )
+        self._store_response(key, model, response)
+        return response
+
+    async def generate_content_async(
+        self,
+        model: GenerativeModel,
+        contents: list,
+        generation_config: Optional[GenerationConfig] = None,
+        safety_settings: Optional[list[SafetySetting]] = None,
+        context: Optional[list[Part]] = None,
+        cache_scope: Optional[str] = None,
+        cache_response: bool = False,
+    ) -> GenerationResponse:
+        """
+        same as generate_content, but the model call does not hold a thread.
+        cache bookkeeping is blocking and runs in the default executor.
+        """
+        context = context or []
+        started_at = time.monotonic()
+        key, cached = await asyncio.to_thread(
+            self._lookup_response,
+            model,
+            context,
+            contents,
+            generation_config,
+            safety_settings,
+            cache_response,
+        )
+        if cached is not None:
+            await asyncio.to_thread(
+                self.notify_cache_hit, model, time.monotonic() - started_at
+            )
+            return cached
+
+        bound_model, prefix = await asyncio.to_thread(
+            self._with_cached_context, model, context, cache_scope
+        )
+        async with self.limiter.acquire_async(
+            "vertexai", self._estimate_tokens(context + contents)
+        ) as lease:
+            response = await bound_model.generate_content_async(
+                prefix + contents,
+                generation_config=generation_config,
+                safety_settings=safety_settings,
+            )
+            lease.report_tokens(response.usage_metadata.total_token_count)
+        await asyncio.to_thread(
+            self.notify_response,
+            response,
+            bound_model,
+            time.monotonic() - started_at,
+            lease.wait_seconds,
+        )
+        await asyncio.to_thread(self._store_response, key, model, response)
+        return response
+
+    def _lookup_response(
+        self,
+        model: GenerativeModel,
+        context: list[Part],
+        contents: list,
+        generation_config: Optional[GenerationConfig],
+        safety_settings: Optional[list[SafetySetting]],
+        cache_response: bool,
+    ) -> tuple[Optional[str], Optional[GenerationResponse]]:
+        if not self.response_cache or not cache_response:
+            return None, None
+        temperature = (generation_config.to_dict() if generation_config else {}).get(
+            "temperature"
+        )
+        if temperature != 0:
+            # a sampled output is not the answer to the same request next time
+            return None, None
+        key = self.response_cache.key(
+            model._model_name,
+            context,
+            contents,
+            generation_config,
+            safety_settings,
+        )
+        text = self.response_cache.get(key)
+        if text is None:
+            return key, None
+        return key, self._response_from_text(text)
+
+    def _store_response(
+        self, key: Optional[str], model: GenerativeModel, response: GenerationResponse
+    ) -> None:
+        if not key:
+            return
+        try:
+            text = response.text
+        except ValueError:
+            # blocked or empty, let the caller see it but don't keep it
+            return
+        self.response_cache.put(key, model._model_name, text)
+
+    def _estimate_tokens(self, contents: list) -> int:
+        """
+        rough admission estimate, settled with the real count after the call
+        """
+        tokens = 0
+        for content in contents:
+            if isinstance(content, str):
+                tokens += len(content) // 4
+            elif isinstance(content, Part) and "text" in content.to_dict():
+                tokens += len(content.text) // 4
+            else:
+                tokens += self.MEDIA_PART_TOKEN_ESTIMATE
+        return tokens
 
-    def notify_response(self, response: GenerationResponse, model: GenerativeModel):
-        print(
+    def _response_from_text(self, text: str) -> GenerationResponse:
+        return GenerationResponse.from_dict(
             {
-                "model": model._model_name,
-                "prompt_tokens": response.usage_metadata.prompt_token_count,
-                "completion_tokens": response.usage_metadata.candidates_token_count,
-                "thoughts_tokens": response.usage_metadata.thoughts_token_count,
-                "cache_tokens": response.usage_metadata.cached_content_token_count,
+                "candidates": [
+                    {"content": {"role": "model", "parts": [{"text": text}]}}
+                ]
             }
         )
+
+    def _with_cached_context(
+        self, model: GenerativeModel, contents: list[Part], scope: Optional[str]
+    ) -> tuple[GenerativeModel, list[Part]]:
+        """
+        returns a model bound to a context cache of `contents`, shared by every call
+        in the same scope (typically a conversation id), and the parts that still
+        have to be sent inline. without a scope, or when the contents can not be
+        cached (e.g. below the minimum token count), nothing is cached.
+        """
+        if scope is None:
+            return model, contents
+
+        key = (model._model_name, self._hash_contents(contents))
+        with self._cache_lock:
+            scoped = self._cached_contents.setdefault(scope, {})
+            future = scoped.get(key)
+            creating = future is None
+            if creating:
+                future = scoped[key] = Future()
+        if creating:
+            # only callers needing this same cache wait for it
+            try:
+                future.set_result(self._create_cached_content(model, contents))
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                # a failed creation is not shared, the next call tries again
+                if future.exception() is not None:
+                    with self._cache_lock:
+                        if self._cached_contents.get(scope, {}).get(key) is future:
+                            del self._cached_contents[scope][key]
+        cached_content = future.result()
+
+        if cached_content is None:
+            return model, contents
+        return GenerativeModel.from_cached_content(cached_content=cached_content), []
+
+    def evict_cached_contents(self, scope: str) -> None:
+        with self._cache_lock:
+            scoped = self._cached_contents.pop(scope, {})
+        for future in scoped.values():
+            if future.exception() is not None:
+                continue
+            cached_content = future.result()
+            if cached_content is None:
+                continue
+            try:
+                cached_content.delete()
+            except Exception as e:
+                # expires by ttl anyway
+                logger.warning("Failed to delete cached content: %s", e)
+
+    def _create_cached_content(
+        self, model: GenerativeModel, contents: list[Part]
+    ) -> Optional[caching.CachedContent]:
+        try:
+            return caching.CachedContent.create(
+                model_name=model._model_name,
+                contents=contents,
+                ttl=self.context_cache_ttl,
+            )
+        except Exception as e:
+            logger.warning("Context cache not created, sending inline: %s", e)
+            return None
+
+    def _hash_contents(self, contents: list[Part]) -> str:
+        digest = hashlib.sha256()
+        for part in contents:
+            digest.update(json.dumps(part.to_dict(), sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def notify_response(
+        self,
+        response: GenerationResponse,
+        model: GenerativeModel,
+        wall_seconds: float = 0,
+        queue_wait_seconds: float = 0,
+    ):
+        usage = response.usage_metadata
+        self.ledger.record(
+            provider="vertexai",
+            model=model._model_name,
+            wall_seconds=wall_seconds,
+            prompt_tokens=usage.prompt_token_count,
+            completion_tokens=usage.candidates_token_count,
+            thoughts_tokens=usage.thoughts_token_count,
+            cached_tokens=usage.cached_content_token_count,
+            queue_wait_seconds=queue_wait_seconds,
+        )
+
+    def notify_cache_hit(self, model: GenerativeModel, wall_seconds: float):
+        self.ledger.record(
+            provider="vertexai",
+            model=model._model_name,
+            wall_seconds=wall_seconds,
+            response_cache_hit=True,
+        )
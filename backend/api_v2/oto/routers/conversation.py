@@ -1,19 +1,43 @@
 import asyncio
+import json
 from datetime import datetime
+from typing import AsyncIterator
 from fastapi import APIRouter, UploadFile, Depends, HTTPException, Query, Body, Path
+from fastapi.responses import StreamingResponse
 from sqlmodel import select, Session
 from oto.infra.storage import get_storage
-from oto.infra.database import get_db_session
-from oto.domain.conversation import Conversation
+from oto.infra.database import get_db_session, create_db_session
+from oto.infra.progress import get_progress_hub
+from oto.domain.conversation import Conversation, ProcessingStatus
+from oto.domain.analysis import ConversationAnalysis
 from oto.routers.deps.auth import require_user_id, require_conversation
 from prefect.deployments import run_deployment
 from oto.services.safety import check_conversation_limit_exceeded
 from oto.infra.job import get_prefect_job_manager
 from prefect.exceptions import ObjectNotFound
+from oto.environment import get_settings
+from oto.tasks.local import get_local_pipeline_executor, LOCAL_RUN_PREFIX
 
 router = APIRouter(prefix="/conversation")
 
 
+async def start_pipeline(conversation_id: str, resume: bool = False) -> str:
+    """
+    returns the id of the flow run, or of the local run without prefect
+    """
+    if get_settings().pipeline_executor == "local":
+        executor = get_local_pipeline_executor()
+        return executor.process_conversation(conversation_id, resume).id
+
+    name = "resume_conversation" if resume else "process_conversation"
+    flow_run = await run_deployment(
+        name=f"{name}/{name}",
+        parameters={"conversation_id": conversation_id},
+        timeout=0,
+    )
+    return str(flow_run.id)
+
+
 @router.post("/create")
 async def create_conversation(
     file: UploadFile,
@@ -46,16 +70,12 @@ async def create_conversation(
     session.refresh(conversation)
     session.commit()
 
-    flow_run = await run_deployment(
-        name="process_conversation/process_conversation",
-        parameters={"conversation_id": conversation.id},
-        timeout=0,
-    )
+    flow_run_id = await start_pipeline(conversation.id)
 
     prefect = get_prefect_job_manager()
     prefect.put_job(
         job_type="process_conversation",
-        flow_run_id=str(flow_run.id),
+        flow_run_id=flow_run_id,
         conversation_id=conversation.id,
         user_id=user_id,
     )
@@ -63,7 +83,7 @@ async def create_conversation(
     return {
         "id": conversation.id,
         "status": conversation.status.value,
-        "flow_run_id": flow_run.id,
+        "flow_run_id": flow_run_id,
     }
 
 
@@ -117,7 +137,123 @@ async def get_conversation_job_status(
     job = prefect.get_job("process_conversation", conversation.id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
+    if job.flow_run_id.startswith(LOCAL_RUN_PREFIX):
+        status = get_local_pipeline_executor().get_status(job.flow_run_id)
+        if not status:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return status
     try:
         return await prefect.get_job_status(job)
     except ObjectNotFound:
         raise HTTPException(status_code=404, detail="Job not found")
+
+
+@router.post("/{conversation_id}/resume")
+async def resume_conversation(
+    conversation: Conversation = Depends(require_conversation),
+    session: Session = Depends(get_db_session),
+):
+    """
+    reruns only the stages a failed run did not finish
+    """
+    if conversation.status != ProcessingStatus.FAILED:
+        raise HTTPException(
+            status_code=409, detail="Only failed conversations can be resumed"
+        )
+
+    try:
+        check_conversation_limit_exceeded()
+    except Exception as _:
+        raise HTTPException(status_code=503, detail="Our server reached its limit")
+
+    conversation.status = ProcessingStatus.PROCESSING
+    conversation.inner_status = "Resuming"
+    session.add(conversation)
+    session.commit()
+    session.refresh(conversation)
+
+    flow_run_id = await start_pipeline(conversation.id, resume=True)
+
+    prefect = get_prefect_job_manager()
+    prefect.put_job(
+        job_type="process_conversation",
+        flow_run_id=flow_run_id,
+        conversation_id=conversation.id,
+        user_id=conversation.user_id,
+    )
+
+    return {
+        "id": conversation.id,
+        "status": conversation.status.value,
+        "flow_run_id": flow_run_id,
+    }
+
+
+ANALYSIS_SECTIONS = ["summary", "highlights", "insights", "breakdown"]
+FINISHED_STATUSES = (ProcessingStatus.COMPLETED.value, ProcessingStatus.FAILED.value)
+
+
+def read_progress(conversation_id: str) -> list[dict]:
+    """
+    the stored progress, as the events the pipeline would have pushed
+    """
+    with create_db_session() as session:
+        conversation = session.get(Conversation, conversation_id)
+        analysis = session.get(ConversationAnalysis, conversation_id)
+    events = [
+        {"type": "section", "section": section}
+        for section in ANALYSIS_SECTIONS
+        if analysis and getattr(analysis, f"{section}_dump")
+    ]
+    events.append(
+        {
+            "type": "status",
+            "status": conversation.status.value,
+            "inner_status": conversation.inner_status,
+        }
+    )
+    return events
+
+
+async def stream_progress(conversation_id: str) -> AsyncIterator[str]:
+    poll_seconds = get_settings().progress_poll_seconds
+    sent_status = None
+    sent_sections: set[str] = set()
+    with get_progress_hub().subscribe(conversation_id) as pushed:
+        # the stored state first, so late subscribers catch up
+        events = await asyncio.to_thread(read_progress, conversation_id)
+        while True:
+            for event in events:
+                if event["type"] == "section":
+                    if event["section"] in sent_sections:
+                        continue
+                    sent_sections.add(event["section"])
+                else:
+                    status = (event["status"], event["inner_status"])
+                    if status == sent_status:
+                        continue
+                    sent_status = status
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if sent_status and sent_status[0] in FINISHED_STATUSES:
+                return
+            try:
+                events = [await asyncio.wait_for(pushed.get(), poll_seconds)]
+            except asyncio.TimeoutError:
+                # nothing pushed, e.g. the pipeline runs on a prefect worker
+                yield ": keep-alive\n\n"
+                events = await asyncio.to_thread(read_progress, conversation_id)
+
+
+@router.get("/{conversation_id}/events")
+async def stream_conversation_progress(
+    conversation: Conversation = Depends(require_conversation),
+):
+    """
+    server-sent events of the status and of the analysis sections as they finish,
+    until the conversation is completed or failed
+    """
+    return StreamingResponse(
+        stream_progress(conversation.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Query
+from oto.routers.deps.auth import require_conversation, require_user_id
+from oto.domain.conversation import Conversation
+from oto.domain.usage import UsageSummary
+from oto.infra.usage import get_usage_ledger
+
+router = APIRouter(prefix="/metrics")
+
+
+@router.get("", response_model=list[UsageSummary])
+async def get_metrics(
+    hours: float = Query(24, gt=0, le=24 * 30),
+    user_id: str = Depends(require_user_id),
+):
+    """
+    provider usage of the user's conversations in the last `hours`,
+    per provider, stage and model, most expensive first
+    """
+    ledger = get_usage_ledger()
+    return ledger.summarize(datetime.now() - timedelta(hours=hours), user_id=user_id)
+
+
+@router.get("/{conversation_id}", response_model=list[UsageSummary])
+async def get_conversation_metrics(
+    hours: float = Query(24 * 30, gt=0, le=24 * 365),
+    conversation: Conversation = Depends(require_conversation),
+):
+    ledger = get_usage_ledger()
+    return ledger.summarize(
+        datetime.now() - timedelta(hours=hours), conversation_id=conversation.id
+    )
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session
 from oto.infra.database import get_db_session
 from oto.domain.conversation import Conversation
 from oto.routers.deps.auth import require_conversation
-from oto.domain.transcript import Captions, Transcript, TranscriptResponse
+from oto.domain.transcript import (
+    CaptionGranularity,
+    Transcript,
+    TranscriptResponse,
+)
 
 
 router = APIRouter(prefix="/transcript")
@@ -13,12 +17,13 @@ router = APIRouter(prefix="/transcript")
 async def get_transcript(
     conversation: Conversation = Depends(require_conversation),
     session: Session = Depends(get_db_session),
+    granularity: CaptionGranularity = Query(default="word"),
 ):
     transcript = session.get(Transcript, conversation.id)
     if not transcript:
         raise HTTPException(status_code=404, detail="Transcript not found")
 
-    captions = Captions.model_validate_json(transcript.captions_dump)
+    captions = transcript.get_captions(granularity)
 
     return TranscriptResponse(
         id=transcript.id,
@@ -1,54 +1,40 @@
+import contextvars
+import hashlib
+import threading
 import time
+import uuid
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
 from pydub import AudioSegment
 from functools import lru_cache
+from typing import Optional
 from oto.environment import get_settings
 from io import BytesIO
+from oto.infra.storage import GoogleCloudStorage, get_storage
+from oto.infra.rate_limit import ProviderLimiter, get_provider_limiter
+from oto.infra.usage import UsageLedger, get_usage_ledger
 # we dont use sieva sdk, because it is shitty sdk, so we use rest api
 
 
 @lru_cache
 def get_audio_enhancer_service() -> "AudioEnhancerService":
     settings = get_settings()
-    return AudioEnhancerService(settings.sieve_api_key)
+    if settings.audio_enhancer_backend == "local":
+        backend = LocalEnhancementBackend()
+    else:
+        backend = SieveBackend(settings.sieve_api_key)
+    return AudioEnhancerService(
+        backend, get_storage(), get_provider_limiter(), get_usage_ledger()
+    )
 
 
-class AudioEnhancerService:
+class SieveBackend:
     def __init__(self, sieve_api_key: str):
         self.sieve_api_key = sieve_api_key
 
-    def enhance_audio(self, signed_url: str, output_format: str = "opus") -> bytes:
-        job_id = self._create_job(signed_url)
-        start_time = time.time()
-        while start_time + 120 > time.time():
-            time.sleep(3)
-            job = self._get_job(job_id)
-            status = job["status"]
-            if status == "processing" or status == "queued" or status == "started":
-                continue
-            elif status == "error":
-                raise Exception(job["error"])
-            elif status == "finished":
-                download_url = job["outputs"][0]["data"]["url"]
-                response = requests.get(download_url)
-                bytes = response.content
-                seg: AudioSegment = AudioSegment.from_file(BytesIO(bytes))
-                bytes_io = BytesIO()
-                seg.export(bytes_io, format=output_format)
-                audio = bytes_io.getvalue()
-                bytes_io.close()
-                return audio
-            else:
-                raise Exception(f"Unknown job status: {status}")
-        raise Exception(f"Job timed out: {job_id}")
-
-    def convert_to_opus(self, bytes: bytes) -> bytes:
-        seg: AudioSegment = AudioSegment.from_file(BytesIO(bytes))
-        bytes_io = BytesIO()
-        seg.export(bytes_io, format="opus")
-        return bytes_io.getvalue()
-
-    def _create_job(self, signed_url: str) -> str:
+    def create_job(self, signed_url: str) -> str:
         response = requests.post(
             "https://mango.sievedata.com/v2/push",
             headers={
@@ -66,7 +52,7 @@ class AudioEnhancerService:
         )
         return response.json()["id"]
 
-    def _get_job(self, job_id: str) -> dict:
+    def get_job(self, job_id: str) -> dict:
         response = requests.get(
             f"https://mango.sievedata.com/v2/jobs/{job_id}",
             headers={
@@ -74,3 +60,227 @@ class AudioEnhancerService:
             },
         )
         return response.json()
+
+
+class LocalEnhancementBackend:
+    """
+    stands in for sieve in tests and local runs, every job finishes on its
+    first poll with the input audio unchanged
+    """
+
+    def __init__(self):
+        self.jobs: dict[str, str] = {}
+
+    def create_job(self, signed_url: str) -> str:
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = signed_url
+        return job_id
+
+    def get_job(self, job_id: str) -> dict:
+        url = self.jobs.pop(job_id)
+        return {"status": "finished", "outputs": [{"data": {"url": url}}]}
+
+
+@dataclass(eq=False)
+class EnhancementJob:
+    job_id: str
+    output_format: str
+    cache_key: Optional[str]
+    future: Future
+    lease: ExitStack
+    started_at: float
+    queue_wait_seconds: float
+    # the submitter's context, so usage is recorded against its stage
+    context: contextvars.Context
+    # polls skipped until this time
+    next_poll_at: float = 0.0
+    interval: float = 0.0
+
+
+class AudioEnhancerService:
+    """
+    submits enhancement jobs without waiting for them. one poller thread follows
+    every job in flight, polling each less often the longer it runs, and
+    resolves its future when it ends. results are kept in storage by the hash
+    of the input audio, so the same audio is never enhanced twice.
+    """
+
+    TIMEOUT_SECONDS = 120
+    MIN_POLL_SECONDS = 1.0
+    MAX_POLL_SECONDS = 10.0
+    BACKOFF = 1.5
+    CACHE_FOLDER = "enhanced"
+
+    def __init__(
+        self,
+        backend,
+        storage: GoogleCloudStorage,
+        limiter: ProviderLimiter,
+        ledger: UsageLedger,
+    ):
+        self.backend = backend
+        self.storage = storage
+        self.limiter = limiter
+        self.ledger = ledger
+        self._jobs: list[EnhancementJob] = []
+        self._in_flight: dict[str, Future] = {}
+        self._changed = threading.Condition()
+        self._poller: Optional[threading.Thread] = None
+        # downloads and transcodes, off the poller thread
+        self._finisher = ThreadPoolExecutor(4, thread_name_prefix="oto-enhance")
+
+    def submit(
+        self,
+        signed_url: str,
+        output_format: str = "opus",
+        audio: Optional[bytes] = None,
+    ) -> Future:
+        """
+        with the `audio` behind `signed_url`, a result enhanced before is reused
+        """
+        cache_key = None
+        if audio is not None:
+            cache_key = hashlib.sha256(audio).hexdigest()
+            cached = self._read_cache(cache_key, output_format)
+            if cached is not None:
+                future: Future = Future()
+                future.set_result(cached)
+                return future
+            with self._changed:
+                if cache_key in self._in_flight:
+                    return self._in_flight[cache_key]
+
+        # a lease is held for the job's lifetime, so max_in_flight bounds sieve jobs
+        started_at = time.monotonic()
+        lease = ExitStack()
+        acquired = lease.enter_context(self.limiter.acquire("sieve"))
+        try:
+            job_id = self.backend.create_job(signed_url)
+        except Exception:
+            lease.close()
+            raise
+        job = EnhancementJob(
+            job_id=job_id,
+            output_format=output_format,
+            cache_key=cache_key,
+            future=Future(),
+            lease=lease,
+            started_at=started_at,
+            queue_wait_seconds=acquired.wait_seconds,
+            context=contextvars.copy_context(),
+            interval=self.MIN_POLL_SECONDS,
+        )
+        job.next_poll_at = time.monotonic() + job.interval
+        with self._changed:
+            self._jobs.append(job)
+            if cache_key:
+                self._in_flight[cache_key] = job.future
+            if not self._poller or not self._poller.is_alive():
+                self._poller = threading.Thread(
+                    target=self._poll, name="oto-enhance-poller", daemon=True
+                )
+                self._poller.start()
+            self._changed.notify()
+        return job.future
+
+    def enhance_audio(self, signed_url: str, output_format: str = "opus") -> bytes:
+        return self.submit(signed_url, output_format).result()
+
+    def _poll(self) -> None:
+        while True:
+            with self._changed:
+                while not self._jobs:
+                    # the thread ends when idle, submit starts another
+                    if not self._changed.wait(timeout=60) and not self._jobs:
+                        self._poller = None
+                        return
+                now = time.monotonic()
+                next_poll_at = min(job.next_poll_at for job in self._jobs)
+                if next_poll_at > now:
+                    self._changed.wait(timeout=next_poll_at - now)
+                    continue
+                due = [job for job in self._jobs if job.next_poll_at <= now]
+
+            for job in due:
+                try:
+                    self._check(job)
+                except Exception as e:
+                    self._finish(job, error=e)
+
+    def _check(self, job: EnhancementJob) -> None:
+        running_seconds = time.monotonic() - job.started_at - job.queue_wait_seconds
+        if running_seconds > self.TIMEOUT_SECONDS:
+            raise Exception(f"Job timed out: {job.job_id}")
+        status_job = self.backend.get_job(job.job_id)
+        status = status_job["status"]
+        if status == "processing" or status == "queued" or status == "started":
+            # a job that is still running is likely to keep running
+            job.interval = min(job.interval * self.BACKOFF, self.MAX_POLL_SECONDS)
+            job.next_poll_at = time.monotonic() + job.interval
+        elif status == "error":
+            raise Exception(status_job["error"])
+        elif status == "finished":
+            with self._changed:
+                self._jobs.remove(job)
+            download_url = status_job["outputs"][0]["data"]["url"]
+            self._finisher.submit(self._download, job, download_url)
+        else:
+            raise Exception(f"Unknown job status: {status}")
+
+    def _download(self, job: EnhancementJob, download_url: str) -> None:
+        try:
+            response = requests.get(download_url)
+            seg: AudioSegment = AudioSegment.from_file(BytesIO(response.content))
+            bytes_io = BytesIO()
+            seg.export(bytes_io, format=job.output_format)
+            audio = bytes_io.getvalue()
+            bytes_io.close()
+            if job.cache_key:
+                self._write_cache(job.cache_key, job.output_format, audio)
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+        self._finish(job, audio=audio)
+
+    def _finish(
+        self,
+        job: EnhancementJob,
+        audio: Optional[bytes] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        with self._changed:
+            if job in self._jobs:
+                self._jobs.remove(job)
+            if job.cache_key:
+                self._in_flight.pop(job.cache_key, None)
+        job.lease.close()
+        if error:
+            job.future.set_exception(error)
+            return
+        job.context.run(
+            self.ledger.record,
+            provider="sieve",
+            model="sieve/audio_enhancement",
+            wall_seconds=time.monotonic() - job.started_at,
+            queue_wait_seconds=job.queue_wait_seconds,
+        )
+        job.future.set_result(audio)
+
+    def _cache_path(self, cache_key: str, output_format: str) -> str:
+        return f"{self.CACHE_FOLDER}/{cache_key}.{output_format}"
+
+    def _read_cache(self, cache_key: str, output_format: str) -> Optional[bytes]:
+        blob = self.storage.bucket.get_blob(self._cache_path(cache_key, output_format))
+        if not blob:
+            return None
+        return blob.download_as_bytes()
+
+    def _write_cache(self, cache_key: str, output_format: str, audio: bytes) -> None:
+        blob = self.storage.bucket.blob(self._cache_path(cache_key, output_format))
+        blob.upload_from_string(audio, content_type=f"audio/{output_format}")
+
+    def convert_to_opus(self, bytes: bytes) -> bytes:
+        seg: AudioSegment = AudioSegment.from_file(BytesIO(bytes))
+        bytes_io = BytesIO()
+        seg.export(bytes_io, format="opus")
+        return bytes_io.getvalue()
@@ -0,0 +1,146 @@
+import string
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Optional
+from oto.environment import get_settings
+from oto.domain.clip import ClipCaption, ClipCaptions
+from oto.domain.transcript import (
+    SENTENCE_ENDINGS,
+    TranscriptColumns,
+    seconds_to_precise_timecode,
+)
+
+PUNCTUATION = string.punctuation + "、。，．！？・…「」『』（）"
+
+
+@lru_cache
+def get_caption_remapper() -> "CaptionRemapper":
+    settings = get_settings()
+    return CaptionRemapper(settings.filler_words)
+
+
+class CaptionRemapper:
+    """
+    builds a clip's captions from the word timings of the transcript, instead
+    of asking gemini to listen to the clip. filler words are cut out, every cut
+    falls between words, and the captions are timed by where each word lands
+    once the kept pieces are joined.
+    """
+
+    EDGE_SECONDS = 0.1  # kept around each piece, when the neighbouring gap allows
+
+    def __init__(self, filler_words: list[str]):
+        self.filler_words = {self._normalize(word) for word in filler_words}
+
+    def remap(
+        self, columns: TranscriptColumns, ranges: list[tuple[float, float]]
+    ) -> tuple[list[tuple[float, float]], ClipCaptions]:
+        """
+        the source pieces to cut, in order, and the captions timed within
+        the clip they make
+        """
+        pieces: list[tuple[float, float]] = []
+        # word index and its start in the clip
+        placed: list[tuple[int, float]] = []
+        offset = 0.0
+        for range_start, range_end in ranges:
+            for run in self._runs(columns, range_start, range_end):
+                first, last = run[0], run[-1]
+                start = self._edge(columns, first, before=True)
+                end = self._edge(columns, last, before=False)
+                start = max(start, range_start)
+                end = min(end, range_end)
+                if end <= start:
+                    continue
+                for i in run:
+                    placed.append((i, offset + max(columns.starts[i] - start, 0.0)))
+                pieces.append((start, end))
+                offset += end - start
+        return pieces, self._captions(columns, placed)
+
+    def _runs(
+        self, columns: TranscriptColumns, range_start: float, range_end: float
+    ) -> list[list[int]]:
+        """
+        consecutive words inside the range, split where a filler word is cut
+        """
+        runs: list[list[int]] = []
+        run: list[int] = []
+        # words whose middle falls in the range
+        i = bisect_left(columns.starts, range_start - 1.0)
+        while i < len(columns) and columns.starts[i] < range_end:
+            middle = (columns.starts[i] + columns.ends[i]) / 2
+            if range_start <= middle <= range_end:
+                if self._normalize(columns.words[i]) in self.filler_words:
+                    if run:
+                        runs.append(run)
+                    run = []
+                else:
+                    run.append(i)
+            i += 1
+        if run:
+            runs.append(run)
+        return runs
+
+    def _edge(self, columns: TranscriptColumns, i: int, before: bool) -> float:
+        # into the silence next to the word, at most halfway to the next word
+        if before:
+            if i == 0:
+                return columns.starts[i] - self.EDGE_SECONDS
+            gap = max(columns.starts[i] - columns.ends[i - 1], 0.0)
+            return columns.starts[i] - min(self.EDGE_SECONDS, gap / 2)
+        if i + 1 == len(columns):
+            return columns.ends[i] + self.EDGE_SECONDS
+        gap = max(columns.starts[i + 1] - columns.ends[i], 0.0)
+        return columns.ends[i] + min(self.EDGE_SECONDS, gap / 2)
+
+    def _only_fillers(self, columns: TranscriptColumns, first: int, last: int) -> bool:
+        return all(
+            self._normalize(columns.words[i]) in self.filler_words
+            for i in range(first, last)
+        )
+
+    def _captions(
+        self,
+        columns: TranscriptColumns,
+        placed: list[tuple[int, float]],
+    ) -> ClipCaptions:
+        """
+        a caption per sentence of one speaker, cut where the clip jumps
+        to other words than over a filler
+        """
+        captions: list[ClipCaption] = []
+        group: list[tuple[int, float]] = []
+
+        def close() -> None:
+            first, start = group[0]
+            last, last_start = group[-1]
+            end = last_start + (columns.ends[last] - columns.starts[last])
+            captions.append(
+                ClipCaption(
+                    timecode_start=seconds_to_precise_timecode(start),
+                    timecode_end=seconds_to_precise_timecode(end),
+                    speaker=columns.speakers[columns.speaker_indices[first]],
+                    # without the fillers cut in between
+                    caption=columns.text_of([i for i, _ in group]),
+                )
+            )
+
+        previous: Optional[int] = None
+        for i, start in placed:
+            if group and (
+                i <= previous
+                or not self._only_fillers(columns, previous + 1, i)
+                or columns.speaker_indices[i] != columns.speaker_indices[previous]
+                or columns.words[previous].rstrip().endswith(SENTENCE_ENDINGS)
+            ):
+                close()
+                group = []
+            group.append((i, start))
+            previous = i
+        if group:
+            close()
+        return ClipCaptions(captions)
+
+    def _normalize(self, word: str) -> str:
+        return word.strip().strip(PUNCTUATION).lower()
@@ -1,8 +1,21 @@
 from oto.infra.vertexai import VertexAI, get_vertexai
 from vertexai.generative_models import Part, GenerationConfig, SafetySetting
 from functools import lru_cache
+from typing import Optional
 from oto.environment import get_settings
-from oto.domain.clip import ClipDatas, ClipCaptions
+from oto.domain.clip import (
+    ClipData,
+    ClipDatas,
+    ClipCaption,
+    ClipCaptions,
+    TranscriptClips,
+)
+from oto.domain.transcript import (
+    TranscriptColumns,
+    seconds_to_timecode,
+    seconds_to_precise_timecode,
+)
+from oto.domain.analysis import ConversationHighlights
 
 
 @lru_cache
@@ -49,7 +62,8 @@ class ClipGeneratorService:
             Part.from_data(audio_buffer, mime_type),
         ]
 
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate_content(
+            self.vertexai.model_large,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
@@ -78,8 +92,6 @@ class ClipGeneratorService:
             safety_settings=self.safety_settings,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model_large)
-
         return ClipCaptions.model_validate_json(response.text)
 
     def _prompt_pretty(self) -> str:
@@ -89,40 +101,45 @@ class ClipGeneratorService:
 タイムスタンプは `MM:SS.SSS` の形式で、ミリセカンドまで指定してください。
 """
 
-    def generate(self, audio_file_path: str, mime_type: str) -> ClipDatas:
-        messages = [
-            self._prompt(),
+    def generate(
+        self, audio_file_path: str, mime_type: str, cache_scope: Optional[str] = None
+    ) -> ClipDatas:
+        audio = [
             Part.from_uri(
                 uri=f"gs://{self.bucket_name}/{audio_file_path}", mime_type=mime_type
-            ),
+            )
         ]
+        messages = [self._prompt()]
 
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate_content(
+            self.vertexai.model_large,
             messages,
             generation_config=self.generation_config,
             safety_settings=self.safety_settings,
+            context=audio,
+            cache_scope=cache_scope,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model_large)
-
         messages.append(self._prompt_2())
 
         print("Stage 2/3: refining...")
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate_content(
+            self.vertexai.model_large,
             messages,
             generation_config=self.generation_config,
             safety_settings=self.safety_settings,
+            context=audio,
+            cache_scope=cache_scope,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model_large)
-
         messages = [
             self._prompt_3(),
             response.text,
         ]
 
         print("Stage 3/3: structuring...")
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate_content(
+            self.vertexai.model_large,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
@@ -157,12 +174,13 @@ class ClipGeneratorService:
                         "required": ["title", "description", "comment", "captions"],
                     },
                 },
+                # a pure restructuring, the same text always gives the same clips
+                temperature=0,
             ),
             safety_settings=self.safety_settings,
+            cache_response=True,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model_large)
-
         return ClipDatas.model_validate_json(response.text)
 
     def _prompt(self) -> str:
@@ -191,4 +209,136 @@ titleはタイトルであり、descriptionは説明文。commentは煽り文句
 内容を変更することはなく、構造化だけを行ってください。
 
 title, description, commentの言語は文字起こしの言語に合うようにしてください。(異なっていれば、title, description, commentを翻訳する必要があります。文字起こしは変更してはいけません)
+"""
+
+    def generate_from_transcript(
+        self,
+        columns: TranscriptColumns,
+        highlights: Optional[ConversationHighlights] = None,
+        cache_scope: Optional[str] = None,
+    ) -> ClipDatas:
+        """
+        picks the clips from the transcript and the highlights as text, instead
+        of the audio. the clips are chosen as ranges of numbered sentences,
+        so their timecodes are the exact word timings of the transcript.
+        """
+        sentences = columns.spans("sentence")
+        transcript = "\n".join(
+            f"#{i} [{seconds_to_timecode(columns.starts[first])}] "
+            f"{columns.speakers[columns.speaker_indices[first]]}: "
+            f"{columns.text(first, last)}"
+            for i, (first, last) in enumerate(sentences)
+        )
+        context = [Part.from_text(transcript)]
+        if highlights and highlights.root:
+            context.append(
+                Part.from_text(
+                    "Highlights:\n"
+                    + "\n".join(
+                        f"[{h.timecode_start_at}-{h.timecode_end_at}] "
+                        f"{h.summary}: {h.highlight}"
+                        for h in highlights.root
+                    )
+                )
+            )
+
+        print("Stage 1/2: selecting from the transcript...")
+        response = self.vertexai.generate_content(
+            self.vertexai.model_large,
+            [self._prompt_transcript()],
+            generation_config=GenerationConfig(max_output_tokens=65535, temperature=1),
+            safety_settings=self.safety_settings,
+            context=context,
+            cache_scope=cache_scope,
+        )
+
+        print("Stage 2/2: structuring...")
+        # only restructures the text above, the small model is enough
+        response = self.vertexai.generate_content(
+            self.vertexai.model,
+            [self._prompt_transcript_structure(), response.text],
+            generation_config=GenerationConfig(
+                max_output_tokens=65535,
+                response_mime_type="application/json",
+                response_schema={
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "title": {"type": "string"},
+                            "description": {"type": "string"},
+                            "comment": {"type": "string"},
+                            "segments": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "first": {"type": "integer"},
+                                        "last": {"type": "integer"},
+                                    },
+                                    "required": ["first", "last"],
+                                },
+                            },
+                        },
+                        "required": ["title", "description", "comment", "segments"],
+                    },
+                },
+                # a pure restructuring, the same text always gives the same clips
+                temperature=0,
+            ),
+            safety_settings=self.safety_settings,
+            cache_response=True,
+        )
+
+        clips = []
+        for clip in TranscriptClips.model_validate_json(response.text).root:
+            captions = []
+            for segment in clip.segments:
+                first, last = sorted((segment.first, segment.last))
+                for first_word, last_word in sentences[max(first, 0) : last + 1]:
+                    captions.append(
+                        ClipCaption(
+                            timecode_start=seconds_to_precise_timecode(
+                                columns.starts[first_word]
+                            ),
+                            timecode_end=seconds_to_precise_timecode(
+                                columns.ends[last_word]
+                            ),
+                            speaker=columns.speakers[
+                                columns.speaker_indices[first_word]
+                            ],
+                            caption=columns.text(first_word, last_word),
+                        )
+                    )
+            if captions:
+                clips.append(
+                    ClipData(
+                        title=clip.title,
+                        description=clip.description,
+                        comment=clip.comment,
+                        captions=ClipCaptions(captions),
+                    )
+                )
+        return ClipDatas(clips)
+
+    def _prompt_transcript(self) -> str:
+        return """これは会話の文字起こしです。各行は `#番号 [開始時刻] 話者: 発言` の形式の1文です。この会話から切り抜きを作成してください。
+
+切り抜く場所についてですが、どんなにイタズラな切り抜き、あまりに取り上げ方が湾曲している、こういったあらゆるテクニックを許容して、むしろ用いて、特別な切り抜きを作り上げてください。つまり恣意的な切り抜きによって、この会話している人物がとてつもなく素晴らしい人間であり、仮にコンテンツとして拡散したら、とてつもなく人気になってしまうであろう切り取りモーメントを作り上げることがあなたの目的です。ハイライトがあれば参考にしてください。
+
+切り抜きを聞いた時に、数秒で驚き、興味を惹かれ、話を聞き、納得で終わる。そのような壮大な美しく楽しめる切り抜きである必要があります。典型的には結論を最初に持ってくるなど、文の順序を入れ替えてもっとドラマティックにしてください。ただし文脈は正しく、邪魔なものは入れない。
+
+さて、そのようなモーメントを3つ挙げてください。それぞれ、30秒以内であることが好ましいでしょう。切り抜きは、再生する順に、行番号の範囲 (例: #12-#15) の一覧で示してください。
+
+そしてその切り抜きの前に、煽り者がいうべきセリフも付け加えてください。"彼は...と, ...といったのです。これを聞いてください" などといった煽りを短的に1文で。"""
+
+    def _prompt_transcript_structure(self) -> str:
+        return """
+これは会話の文字起こしから作成した切り抜きの情報です。この情報を正しく構造化してください。
+titleはタイトルであり、descriptionは説明文。commentは煽り文句などの説明スクリプトであり、読み上げに使用するため、ナチュラルな文章のみが入ります。
+segmentsは再生する順の行番号の範囲で、firstとlastはその範囲の最初と最後の行番号です (両端を含む)。
+
+内容を変更することはなく、構造化だけを行ってください。
+
+title, description, commentの言語は文字起こしの言語に合うようにしてください。
 """
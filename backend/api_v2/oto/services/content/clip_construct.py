@@ -1,96 +1,157 @@
-from pydub import AudioSegment
 from oto.infra.vertexai import VertexAI, get_vertexai
 from vertexai.generative_models import Part, GenerationConfig
 from functools import lru_cache
+from typing import Optional
 from oto.environment import get_settings
+from oto.infra import ffmpeg
 from oto.domain.clip import ClipDatas, ClipCaptions
-from typing import BinaryIO
-from io import BytesIO
-import pydub
-from oto.infra.storage import get_storage
+from oto.domain.transcript import seconds_to_precise_timecode
+from oto.services.content.range_plan import plan_ranges
+
+
+# how each clip is handed to gemini, uploaded and enhanced
+INTERMEDIATE_FORMATS: dict[str, tuple[list[str], str]] = {
+    "flac": (["-c:a", "flac", "-f", "flac"], "audio/flac"),
+    "opus": (["-c:a", "libopus", "-b:a", "64k", "-f", "ogg"], "audio/ogg"),
+}
 
 
 @lru_cache
 def get_clip_construct_service() -> "ClipConstructService":
     settings = get_settings()
-    return ClipConstructService(get_vertexai(), settings.google_cloud_bucket_name)
+    return ClipConstructService(
+        get_vertexai(),
+        settings.google_cloud_bucket_name,
+        settings.clip_intermediate_format,
+    )
 
 
 class ClipConstructService:
-    def __init__(self, vertexai: VertexAI, bucket_name: str):
+    """
+    cuts clips out of a local copy of the source with ffmpeg, which seeks to
+    each range instead of decoding the whole file, and joins the ranges in one
+    filter graph into a compressed `intermediate_format`
+    """
+
+    def __init__(
+        self, vertexai: VertexAI, bucket_name: str, intermediate_format: str = "flac"
+    ):
         self.vertexai = vertexai
         self.bucket_name = bucket_name
+        self.intermediate_format = intermediate_format
+        self.codec_args, self.mime_type = INTERMEDIATE_FORMATS[intermediate_format]
 
-    def construct(self, audio_data: BinaryIO, clip_datas: ClipDatas) -> ClipDatas:
-        audio_segment: AudioSegment = AudioSegment.from_file(audio_data)
-        audio_duration = audio_segment.duration_seconds
-
+    def construct(self, source_path: str, clip_datas: ClipDatas) -> ClipDatas:
+        """
+        sets each clip's audio and the source ranges it was cut from,
+        a clip with nothing to cut is left without audio
+        """
+        self.plan(source_path, clip_datas)
         for clip_data in clip_datas.root:
-            clip = AudioSegment.empty()
-            contained_ranges: list[tuple[float, float]] = []
-            for caption in clip_data.captions.root:
-                start_time = self.timecode_to_seconds(caption.timecode_start)
-                # include -1 seconds if not overlapping with other captions
-                if not self.is_already_contained(start_time - 1, contained_ranges):
-                    start_time = start_time - 1
-                if start_time < 0:
-                    start_time = 0
-                end_time = self.timecode_to_seconds(caption.timecode_end)
-                # include +1 seconds if not overlapping with other captions
-                if not self.is_already_contained(end_time + 1, contained_ranges):
-                    end_time = end_time + 1
-                if end_time > audio_duration:
-                    end_time = audio_duration
-
-                contained_ranges.append((start_time, end_time))
-                clip += audio_segment[start_time * 1000 : end_time * 1000]
-            bytes_io = BytesIO()
-            clip.export(bytes_io, format="wav")
-            clip_data.audio = bytes_io.getvalue()
-            bytes_io.close()
+            if clip_data.ranges:
+                clip_data.audio = self.extract(source_path, clip_data.ranges)
+        return clip_datas
 
+    def plan(self, source_path: str, clip_datas: ClipDatas) -> ClipDatas:
+        """
+        sets only the source ranges of each clip
+        """
+        duration = self.probe_duration(source_path)
+        for clip_data in clip_datas.root:
+            clip_data.ranges = self.plan_ranges(clip_data.captions, duration)
         return clip_datas
 
-    def is_already_contained(
-        self, target_time: float, contained_ranges: list[tuple[float, float]]
-    ) -> bool:
-        for contained_start, contained_end in contained_ranges:
-            if target_time > contained_start and target_time < contained_end:
-                return True
-        return False
+    def plan_ranges(
+        self, captions: ClipCaptions, audio_duration: float
+    ) -> list[tuple[float, float]]:
+        """
+        the source ranges the clip is cut from, in the captions' order
+        """
+        return plan_ranges(
+            [
+                (
+                    self.timecode_to_seconds(caption.timecode_start),
+                    self.timecode_to_seconds(caption.timecode_end),
+                )
+                for caption in captions.root
+            ],
+            audio_duration,
+        )
 
     def construct_with_captions(
-        self, audio_data: BinaryIO, captions: ClipCaptions
-    ) -> tuple[bytes, ClipCaptions]:
+        self,
+        source_path: str,
+        ranges: list[tuple[float, float]],
+        captions: ClipCaptions,
+    ) -> tuple[Optional[bytes], ClipCaptions]:
+        """
+        `captions` are timed within the clip cut from `ranges`, the new clip is
+        cut from the source again rather than from that clip.
+        no audio when the captions cover nothing of it.
+        """
         captions = captions.model_copy(deep=True)
-        audio_segment: AudioSegment = AudioSegment.from_file(audio_data)
 
-        clip = AudioSegment.empty()
+        source_ranges: list[tuple[float, float]] = []
+        offset = 0.0
         for caption in captions.root:
-            new_start_seconds = clip.duration_seconds
-            start_time = self.timecode_to_seconds(caption.timecode_start)
-            end_time = self.timecode_to_seconds(caption.timecode_end)
-            clip += audio_segment[start_time * 1000 : end_time * 1000]
-            new_end_seconds = clip.duration_seconds
-            caption.timecode_start = self.seconds_to_timecode(new_start_seconds)
-            caption.timecode_end = self.seconds_to_timecode(new_end_seconds)
-            print(caption.timecode_start, caption.timecode_end)
-        bytes_io = BytesIO()
-        clip.export(bytes_io, format="wav")
-        audio = bytes_io.getvalue()
-        bytes_io.close()
+            pieces = self.to_source_ranges(
+                ranges,
+                self.timecode_to_seconds(caption.timecode_start),
+                self.timecode_to_seconds(caption.timecode_end),
+            )
+            source_ranges += pieces
+            # where the caption lands in the new clip
+            caption.timecode_start = seconds_to_precise_timecode(offset)
+            offset += sum(end - start for start, end in pieces)
+            caption.timecode_end = seconds_to_precise_timecode(offset)
+        if not source_ranges:
+            return None, captions
+        audio = self.extract(source_path, source_ranges)
 
         return audio, captions
 
-    def seconds_to_timecode(self, seconds: float) -> str:
-        # h, m, s, ms
-        timecode = ""
-        hours = int(seconds // 3600)
-        seconds %= 3600
-        minutes = int(seconds // 60)
-        seconds %= 60
-        timecode = f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
-        return timecode
+    def to_source_ranges(
+        self, ranges: list[tuple[float, float]], start: float, end: float
+    ) -> list[tuple[float, float]]:
+        """
+        the source ranges behind `start` to `end` of the clip cut from `ranges`
+        """
+        pieces: list[tuple[float, float]] = []
+        offset = 0.0
+        for range_start, range_end in ranges:
+            length = range_end - range_start
+            low = max(start, offset)
+            high = min(end, offset + length)
+            if high > low:
+                pieces.append((range_start + low - offset, range_start + high - offset))
+            offset += length
+        return pieces
+
+    def extract(self, source_path: str, ranges: list[tuple[float, float]]) -> bytes:
+        """
+        the ranges, in order, as one clip in the intermediate format
+        """
+        ranges = [(start, end) for start, end in ranges if end > start]
+        if not ranges:
+            raise ValueError("Nothing to extract, the ranges are empty")
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        for start, end in ranges:
+            # before -i, so ffmpeg seeks instead of decoding up to the start
+            command += ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}"]
+            command += ["-i", source_path]
+        inputs = "".join(f"[{i}:a]" for i in range(len(ranges)))
+        command += [
+            "-filter_complex",
+            f"{inputs}concat=n={len(ranges)}:v=0:a=1[out]",
+            "-map",
+            "[out]",
+            *self.codec_args,
+            "pipe:1",
+        ]
+        return ffmpeg.run(command).stdout
+
+    def probe_duration(self, source_path: str) -> float:
+        return ffmpeg.probe_duration(source_path)
 
     def timecode_to_seconds(self, timecode: str) -> float:
         milliseconds = 0
@@ -0,0 +1,48 @@
+from bisect import bisect_right
+from typing import Optional
+
+
+def plan_ranges(
+    intervals: list[tuple[float, float]], duration: float, padding: float = 1.0
+) -> list[tuple[float, float]]:
+    """
+    the source ranges to cut, in the order of `intervals`, which may be
+    reordered for effect. each interval is padded by `padding` seconds on both
+    sides, but never past halfway to another interval, and clamped to the audio.
+    consecutive ranges that overlap or touch are merged into one.
+    """
+    cores = [
+        (min(max(start, 0.0), duration), min(max(end, 0.0), duration))
+        for start, end in intervals
+    ]
+    by_start = sorted(range(len(cores)), key=lambda i: cores[i])
+    starts = [cores[i][0] for i in by_start]
+
+    padded: list[tuple[float, float]] = [(0.0, 0.0)] * len(cores)
+    # the latest end of the intervals starting earlier
+    reached: Optional[float] = None
+    for i in by_start:
+        start, end = cores[i]
+        low = max(start - padding, 0.0)
+        if reached is not None:
+            # a gap to a neighbour is shared, half of it each
+            low = max(low, (reached + start) / 2) if reached < start else start
+        high = min(end + padding, duration)
+        following = bisect_right(starts, end)
+        if following < len(starts):
+            high = min(high, (end + starts[following]) / 2)
+        padded[i] = (low, high)
+        reached = end if reached is None else max(reached, end)
+
+    plan: list[tuple[float, float]] = []
+    for start, end in padded:
+        if end <= start:
+            continue
+        if plan:
+            last_start, last_end = plan[-1]
+            if last_start <= start <= last_end:
+                # continues the previous range, or is already part of it
+                plan[-1] = (last_start, max(last_end, end))
+                continue
+        plan.append((start, end))
+    return plan
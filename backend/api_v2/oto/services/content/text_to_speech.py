@@ -1,31 +1,114 @@
-from pydub import AudioSegment
+import contextvars
+import hashlib
+import json
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import lru_cache
 from oto.environment import get_settings
-from io import BytesIO
 from openai import OpenAI
+from oto.infra.storage import GoogleCloudStorage, get_storage
+from oto.infra.rate_limit import ProviderLimiter, get_provider_limiter
+from oto.infra.usage import UsageLedger, get_usage_ledger
 
 
 @lru_cache
 def get_text_to_speech_service() -> "TextToSpeechService":
     settings = get_settings()
-    return TextToSpeechService(settings.openai_api_key)
+    return TextToSpeechService(
+        settings.openai_api_key,
+        get_storage(),
+        get_provider_limiter(),
+        get_usage_ledger(),
+        concurrency=settings.tts_concurrency,
+    )
 
 
 class TextToSpeechService:
-    def __init__(self, openai_api_key: str):
-        self.openai_api_key = openai_api_key
-
-    def generate(self, text: str, format: str = "opus") -> bytes:
-        client = OpenAI(api_key=self.openai_api_key)
-        response = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
-            input=text,
-            voice="nova",
-            instructions="Speak in a calm and soothing tone",
+    """
+    speech is streamed from the provider straight into storage, under the
+    user's folder and the hash of everything that shapes it, so the same text
+    is only synthesized once per user
+    """
+
+    MODEL = "gpt-4o-mini-tts"
+    VOICE = "nova"
+    INSTRUCTIONS = "Speak in a calm and soothing tone"
+    FOLDER = "clip_comments"
+    CHUNK_BYTES = 64 * 1024
+
+    def __init__(
+        self,
+        openai_api_key: str,
+        storage: GoogleCloudStorage,
+        limiter: ProviderLimiter,
+        ledger: UsageLedger,
+        concurrency: int = 8,
+    ):
+        # one client, so its connections are reused across calls
+        self.client = OpenAI(api_key=openai_api_key)
+        self.storage = storage
+        self.limiter = limiter
+        self.ledger = ledger
+        self._pool = ThreadPoolExecutor(concurrency, thread_name_prefix="oto-tts")
+
+    def path(self, text: str, user_id: str, format: str = "opus") -> str:
+        key = hashlib.sha256(
+            json.dumps(
+                [self.MODEL, self.VOICE, self.INSTRUCTIONS, format, text],
+                ensure_ascii=False,
+            ).encode("utf-8")
+        ).hexdigest()
+        return f"{self.FOLDER}/{user_id}/{key}.{format}"
+
+    def synthesize(self, text: str, user_id: str, format: str = "opus") -> str:
+        """
+        returns the storage path of the speech
+        """
+        path = self.path(text, user_id, format)
+        blob = self.storage.bucket.blob(path)
+        if blob.exists():
+            return path
+
+        started_at = time.monotonic()
+        # streamed to a key of this request alone, the shared key only ever
+        # holds complete speech, whoever writes it
+        partial = self.storage.bucket.blob(
+            f"{self.FOLDER}/{user_id}/partial/{uuid.uuid4().hex}.{format}"
+        )
+        with self.limiter.acquire("openai_tts") as lease:
+            try:
+                with self.client.audio.speech.with_streaming_response.create(
+                    model=self.MODEL,
+                    input=text,
+                    voice=self.VOICE,
+                    instructions=self.INSTRUCTIONS,
+                    response_format=format,
+                ) as response:
+                    with partial.open("wb", content_type=f"audio/{format}") as writer:
+                        for chunk in response.iter_bytes(self.CHUNK_BYTES):
+                            writer.write(chunk)
+                self.storage.bucket.copy_blob(partial, self.storage.bucket, path)
+            finally:
+                if partial.exists():
+                    partial.delete()
+        self.ledger.record(
+            provider="openai_tts",
+            model=self.MODEL,
+            wall_seconds=time.monotonic() - started_at,
+            queue_wait_seconds=lease.wait_seconds,
         )
-        seg: AudioSegment = AudioSegment.from_file(BytesIO(response.content))
-        bytes_io = BytesIO()
-        seg.export(bytes_io, format=format)
-        audio = bytes_io.getvalue()
-        bytes_io.close()
-        return audio
+        return path
+
+    def synthesize_all(
+        self, texts: list[str], user_id: str, format: str = "opus"
+    ) -> list[Future]:
+        """
+        futures of the storage paths, in the order of `texts`
+        """
+        return [
+            self._pool.submit(
+                contextvars.copy_context().run, self.synthesize, text, user_id, format
+            )
+            for text in texts
+        ]
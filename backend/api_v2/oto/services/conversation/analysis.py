@@ -0,0 +1,124 @@
+from oto.infra.vertexai import VertexAI, get_vertexai
+from vertexai.generative_models import Part, GenerationConfig
+from oto.domain.transcript import Captions
+from oto.domain.analysis import ConversationAnalysisData
+from functools import lru_cache
+from typing import Optional
+from oto.services.transcript_prompt import (
+    TranscriptPromptRenderer,
+    get_transcript_prompt_renderer,
+)
+from oto.services.conversation.summary import (
+    ConversationSummaryService,
+    get_conversation_summary_service,
+)
+from oto.services.conversation.highlight import (
+    ConversationHighlightService,
+    get_conversation_highlight_service,
+)
+from oto.services.conversation.insight import (
+    ConversationInsightService,
+    get_conversation_insight_service,
+)
+from oto.services.conversation.breakdown import (
+    ConversationBreakdownService,
+    get_conversation_breakdown_service,
+)
+
+
+@lru_cache
+def get_conversation_analysis_service() -> "ConversationAnalysisService":
+    return ConversationAnalysisService(
+        get_vertexai(),
+        get_transcript_prompt_renderer(),
+        get_conversation_summary_service(),
+        get_conversation_highlight_service(),
+        get_conversation_insight_service(),
+        get_conversation_breakdown_service(),
+    )
+
+
+class ConversationAnalysisService:
+    """
+    summary, highlights, insights and breakdown in one structured output call
+    """
+
+    def __init__(
+        self,
+        vertexai: VertexAI,
+        renderer: TranscriptPromptRenderer,
+        summary_service: ConversationSummaryService,
+        highlight_service: ConversationHighlightService,
+        insight_service: ConversationInsightService,
+        breakdown_service: ConversationBreakdownService,
+    ):
+        self.vertexai = vertexai
+        self.renderer = renderer
+        self.summary_service = summary_service
+        self.highlight_service = highlight_service
+        self.insight_service = insight_service
+        self.breakdown_service = breakdown_service
+
+    def get_analysis(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationAnalysisData:
+        """
+        raises pydantic.ValidationError when the response does not match the schema
+        """
+        response = self.vertexai.generate_content(
+            **self._request(captions, cache_scope)
+        )
+
+        analysis = ConversationAnalysisData.model_validate_json(response.text)
+        return analysis
+
+    async def get_analysis_async(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationAnalysisData:
+        response = await self.vertexai.generate_content_async(
+            **self._request(captions, cache_scope)
+        )
+
+        analysis = ConversationAnalysisData.model_validate_json(response.text)
+        return analysis
+
+    def _request(self, captions: Captions, cache_scope: Optional[str]) -> dict:
+        return dict(
+            model=self.vertexai.model,
+            contents=[self._prompt()],
+            generation_config=GenerationConfig(
+                max_output_tokens=65535,
+                response_mime_type="application/json",
+                response_schema=self.response_schema(),
+            ),
+            context=[Part.from_text(self.renderer.render(captions).text)],
+            cache_scope=cache_scope,
+        )
+
+    def response_schema(self) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "summary": self.summary_service.response_schema(),
+                "highlights": self.highlight_service.response_schema(),
+                "insights": self.insight_service.response_schema(),
+                "breakdown": self.breakdown_service.response_schema(),
+            },
+            "required": ["summary", "highlights", "insights", "breakdown"],
+        }
+
+    def _prompt(self) -> str:
+        return """Please analyze this transcript and fill in every section below.
+
+summary: Create an overall summary of this transcript under 100 words.
+
+highlights: Create highlights from this transcript, dividing it into appropriate sections.
+Then, for the part you find most interesting, set `"favorite": true` (at least one, but not too many—choose the most compelling segment overall).
+
+insights: Provide insights on this conversation. Please be honest and offer observations that will help the speaker.
+Scores should be given as percentages in decimal form (0–1).
+
+breakdown: Provide a breakdown of this conversation.
+Metadata may be estimated (empty allowed).
+Sentiment should be determined from the emotional tone of the dialogue and expressed as values between 0 and 1.
+Keywords should identify notable terms and assign each an importance score."""
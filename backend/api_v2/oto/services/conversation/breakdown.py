@@ -3,88 +3,113 @@ from vertexai.generative_models import Part, GenerationConfig
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationBreakdown
 from functools import lru_cache
+from typing import Optional
+from oto.services.transcript_prompt import (
+    TranscriptPromptRenderer,
+    get_transcript_prompt_renderer,
+)
 
 
 @lru_cache
 def get_conversation_breakdown_service() -> "ConversationBreakdownService":
-    return ConversationBreakdownService(get_vertexai())
+    return ConversationBreakdownService(
+        get_vertexai(), get_transcript_prompt_renderer()
+    )
 
 
 class ConversationBreakdownService:
-    def __init__(self, vertexai: VertexAI):
+    def __init__(self, vertexai: VertexAI, renderer: TranscriptPromptRenderer):
         self.vertexai = vertexai
+        self.renderer = renderer
 
-    def get_breakdown(self, captions: Captions) -> ConversationBreakdown:
-        messages = [
-            Part.from_text(captions.model_dump_json()),
-            self._prompt(),
-        ]
-        response = self.vertexai.model.generate_content(
-            messages,
+    def get_breakdown(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationBreakdown:
+        response = self.vertexai.generate_content(
+            **self._request(captions, cache_scope)
+        )
+
+        breakdown = ConversationBreakdown.model_validate_json(response.text)
+        return breakdown
+
+    async def get_breakdown_async(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationBreakdown:
+        response = await self.vertexai.generate_content_async(
+            **self._request(captions, cache_scope)
+        )
+
+        breakdown = ConversationBreakdown.model_validate_json(response.text)
+        return breakdown
+
+    def _request(self, captions: Captions, cache_scope: Optional[str]) -> dict:
+        return dict(
+            model=self.vertexai.model,
+            contents=[self._prompt()],
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
-                response_schema={
+                response_schema=self.response_schema(),
+            ),
+            context=[Part.from_text(self.renderer.render(captions).text)],
+            cache_scope=cache_scope,
+        )
+
+    def response_schema(self) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "metadata": {
                     "type": "object",
                     "properties": {
-                        "metadata": {
-                            "type": "object",
-                            "properties": {
-                                "duration": {"type": "string"},
-                                "language": {"type": "string"},
-                                "situation": {"type": "string"},
-                                "place": {"type": "string"},
-                                "time": {"type": "string"},
-                                "location": {"type": "string"},
-                                "participants": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                },
-                            },
-                            "required": [
-                                "duration",
-                                "language",
-                                "situation",
-                                "place",
-                                "time",
-                                "location",
-                                "participants",
-                            ],
-                        },
-                        "sentiment": {
-                            "type": "object",
-                            "properties": {
-                                "positive": {"type": "number"},
-                                "neutral": {"type": "number"},
-                                "negative": {"type": "number"},
-                            },
-                            "required": ["positive", "neutral", "negative"],
-                        },
-                        "keywords": {
+                        "duration": {"type": "string"},
+                        "language": {"type": "string"},
+                        "situation": {"type": "string"},
+                        "place": {"type": "string"},
+                        "time": {"type": "string"},
+                        "location": {"type": "string"},
+                        "participants": {
                             "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "keyword": {"type": "string"},
-                                    "importance_score": {"type": "number"},
-                                },
-                                "required": ["keyword", "importance_score"],
-                            },
+                            "items": {"type": "string"},
                         },
                     },
                     "required": [
-                        "metadata",
-                        "sentiment",
-                        "keywords",
+                        "duration",
+                        "language",
+                        "situation",
+                        "place",
+                        "time",
+                        "location",
+                        "participants",
                     ],
                 },
-            ),
-        )
-
-        self.vertexai.notify_response(response, self.vertexai.model)
-
-        breakdown = ConversationBreakdown.model_validate_json(response.text)
-        return breakdown
+                "sentiment": {
+                    "type": "object",
+                    "properties": {
+                        "positive": {"type": "number"},
+                        "neutral": {"type": "number"},
+                        "negative": {"type": "number"},
+                    },
+                    "required": ["positive", "neutral", "negative"],
+                },
+                "keywords": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "keyword": {"type": "string"},
+                            "importance_score": {"type": "number"},
+                        },
+                        "required": ["keyword", "importance_score"],
+                    },
+                },
+            },
+            "required": [
+                "metadata",
+                "sentiment",
+                "keywords",
+            ],
+        }
 
     def _prompt(self) -> str:
         return """Please provide a breakdown of this conversation.
@@ -3,54 +3,79 @@ from vertexai.generative_models import Part, GenerationConfig
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationHighlights
 from functools import lru_cache
+from typing import Optional
+from oto.services.transcript_prompt import (
+    TranscriptPromptRenderer,
+    get_transcript_prompt_renderer,
+)
 
 
 @lru_cache
 def get_conversation_highlight_service() -> "ConversationHighlightService":
-    return ConversationHighlightService(get_vertexai())
+    return ConversationHighlightService(
+        get_vertexai(), get_transcript_prompt_renderer()
+    )
 
 
 class ConversationHighlightService:
-    def __init__(self, vertexai: VertexAI):
+    def __init__(self, vertexai: VertexAI, renderer: TranscriptPromptRenderer):
         self.vertexai = vertexai
+        self.renderer = renderer
 
-    def get_highlights(self, captions: Captions) -> ConversationHighlights:
-        messages = [
-            Part.from_text(captions.model_dump_json()),
-            self._prompt(),
-        ]
-        response = self.vertexai.model.generate_content(
-            messages,
+    def get_highlights(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationHighlights:
+        response = self.vertexai.generate_content(
+            **self._request(captions, cache_scope)
+        )
+
+        highlights = ConversationHighlights.model_validate_json(response.text)
+        return highlights
+
+    async def get_highlights_async(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationHighlights:
+        response = await self.vertexai.generate_content_async(
+            **self._request(captions, cache_scope)
+        )
+
+        highlights = ConversationHighlights.model_validate_json(response.text)
+        return highlights
+
+    def _request(self, captions: Captions, cache_scope: Optional[str]) -> dict:
+        return dict(
+            model=self.vertexai.model,
+            contents=[self._prompt()],
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
-                response_schema={
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "summary": {"type": "string"},
-                            "highlight": {"type": "string"},
-                            "timecode_start_at": {"type": "string"},
-                            "timecode_end_at": {"type": "string"},
-                            "favorite": {"type": "boolean"},
-                        },
-                        "required": [
-                            "summary",
-                            "highlight",
-                            "timecode_start_at",
-                            "timecode_end_at",
-                            "favorite",
-                        ],
-                    },
-                },
+                response_schema=self.response_schema(),
             ),
+            context=[Part.from_text(self.renderer.render(captions).text)],
+            cache_scope=cache_scope,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model)
-
-        highlights = ConversationHighlights.model_validate_json(response.text)
-        return highlights
+    def response_schema(self) -> dict:
+        return {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "summary": {"type": "string"},
+                    "highlight": {"type": "string"},
+                    "timecode_start_at": {"type": "string"},
+                    "timecode_end_at": {"type": "string"},
+                    "favorite": {"type": "boolean"},
+                },
+                "required": [
+                    "summary",
+                    "highlight",
+                    "timecode_start_at",
+                    "timecode_end_at",
+                    "favorite",
+                ],
+            },
+        }
 
     def _prompt(self) -> str:
         return """Please create highlights from this transcript, dividing it into appropriate sections.  
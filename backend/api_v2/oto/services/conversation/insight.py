@@ -3,56 +3,79 @@ from vertexai.generative_models import Part, GenerationConfig
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationInsight
 from functools import lru_cache
+from typing import Optional
+from oto.services.transcript_prompt import (
+    TranscriptPromptRenderer,
+    get_transcript_prompt_renderer,
+)
 
 
 @lru_cache
 def get_conversation_insight_service() -> "ConversationInsightService":
-    return ConversationInsightService(get_vertexai())
+    return ConversationInsightService(get_vertexai(), get_transcript_prompt_renderer())
 
 
 class ConversationInsightService:
-    def __init__(self, vertexai: VertexAI):
+    def __init__(self, vertexai: VertexAI, renderer: TranscriptPromptRenderer):
         self.vertexai = vertexai
+        self.renderer = renderer
 
-    def get_insights(self, captions: Captions) -> ConversationInsight:
-        messages = [
-            Part.from_text(captions.model_dump_json()),
-            self._prompt(),
-        ]
-        response = self.vertexai.model.generate_content(
-            messages,
+    def get_insights(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationInsight:
+        response = self.vertexai.generate_content(
+            **self._request(captions, cache_scope)
+        )
+
+        insights = ConversationInsight.model_validate_json(response.text)
+        return insights
+
+    async def get_insights_async(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationInsight:
+        response = await self.vertexai.generate_content_async(
+            **self._request(captions, cache_scope)
+        )
+
+        insights = ConversationInsight.model_validate_json(response.text)
+        return insights
+
+    def _request(self, captions: Captions, cache_scope: Optional[str]) -> dict:
+        return dict(
+            model=self.vertexai.model,
+            contents=[self._prompt()],
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
-                response_schema={
-                    "type": "object",
-                    "properties": {
-                        "suggestions": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                        },
-                        "boring_score": {"type": "number"},
-                        "density_score": {"type": "number"},
-                        "clarity_score": {"type": "number"},
-                        "engagement_score": {"type": "number"},
-                        "interesting_score": {"type": "number"},
-                    },
-                    "required": [
-                        "suggestions",
-                        "boring_score",
-                        "density_score",
-                        "clarity_score",
-                        "engagement_score",
-                        "interesting_score",
-                    ],
-                },
+                response_schema=self.response_schema(),
             ),
+            context=[Part.from_text(self.renderer.render(captions).text)],
+            cache_scope=cache_scope,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model)
-
-        insights = ConversationInsight.model_validate_json(response.text)
-        return insights
+    def response_schema(self) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "suggestions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                },
+                "boring_score": {"type": "number"},
+                "density_score": {"type": "number"},
+                "clarity_score": {"type": "number"},
+                "engagement_score": {"type": "number"},
+                "interesting_score": {"type": "number"},
+            },
+            "required": [
+                "suggestions",
+                "boring_score",
+                "density_score",
+                "clarity_score",
+                "engagement_score",
+                "interesting_score",
+            ],
+        }
 
     def _prompt(self) -> str:
         return """Let's provide insights on this conversation. Please be honest and offer observations that will help the speaker.  
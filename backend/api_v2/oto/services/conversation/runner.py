@@ -0,0 +1,86 @@
+import asyncio
+from functools import lru_cache
+from typing import Awaitable, Optional, TypeVar
+from oto.domain.transcript import Captions
+from oto.domain.analysis import ConversationAnalysisData
+from oto.infra.usage import usage_stage
+from oto.services.conversation.summary import (
+    ConversationSummaryService,
+    get_conversation_summary_service,
+)
+from oto.services.conversation.highlight import (
+    ConversationHighlightService,
+    get_conversation_highlight_service,
+)
+from oto.services.conversation.insight import (
+    ConversationInsightService,
+    get_conversation_insight_service,
+)
+from oto.services.conversation.breakdown import (
+    ConversationBreakdownService,
+    get_conversation_breakdown_service,
+)
+
+T = TypeVar("T")
+
+
+@lru_cache
+def get_conversation_analysis_runner() -> "ConversationAnalysisRunner":
+    return ConversationAnalysisRunner(
+        get_conversation_summary_service(),
+        get_conversation_highlight_service(),
+        get_conversation_insight_service(),
+        get_conversation_breakdown_service(),
+    )
+
+
+class ConversationAnalysisRunner:
+    """
+    fans out every analysis section of a conversation on one event loop,
+    instead of one worker thread per section
+    """
+
+    def __init__(
+        self,
+        summary_service: ConversationSummaryService,
+        highlight_service: ConversationHighlightService,
+        insight_service: ConversationInsightService,
+        breakdown_service: ConversationBreakdownService,
+    ):
+        self.summary_service = summary_service
+        self.highlight_service = highlight_service
+        self.insight_service = insight_service
+        self.breakdown_service = breakdown_service
+
+    async def run(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationAnalysisData:
+        summary, highlights, insights, breakdown = await asyncio.gather(
+            self._staged(
+                "summary",
+                self.summary_service.get_summary_async(captions, cache_scope),
+            ),
+            self._staged(
+                "highlights",
+                self.highlight_service.get_highlights_async(captions, cache_scope),
+            ),
+            self._staged(
+                "insights",
+                self.insight_service.get_insights_async(captions, cache_scope),
+            ),
+            self._staged(
+                "breakdown",
+                self.breakdown_service.get_breakdown_async(captions, cache_scope),
+            ),
+        )
+        return ConversationAnalysisData(
+            summary=summary,
+            highlights=highlights,
+            insights=insights,
+            breakdown=breakdown,
+        )
+
+    async def _staged(self, stage: str, awaitable: Awaitable[T]) -> T:
+        # gather runs each one in its own task, so the stage stays per section
+        with usage_stage(stage):
+            return await awaitable
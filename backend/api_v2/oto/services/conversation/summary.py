@@ -3,39 +3,62 @@ from vertexai.generative_models import Part, GenerationConfig
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationSummary
 from functools import lru_cache
+from typing import Optional
+from oto.services.transcript_prompt import (
+    TranscriptPromptRenderer,
+    get_transcript_prompt_renderer,
+)
 
 
 @lru_cache
 def get_conversation_summary_service() -> "ConversationSummaryService":
-    return ConversationSummaryService(get_vertexai())
+    return ConversationSummaryService(get_vertexai(), get_transcript_prompt_renderer())
 
 
 class ConversationSummaryService:
-    def __init__(self, vertexai: VertexAI):
+    def __init__(self, vertexai: VertexAI, renderer: TranscriptPromptRenderer):
         self.vertexai = vertexai
+        self.renderer = renderer
 
-    def get_summary(self, captions: Captions) -> ConversationSummary:
-        messages = [
-            Part.from_text(captions.model_dump_json()),
-            self._prompt(),
-        ]
-        response = self.vertexai.model.generate_content(
-            messages,
+    def get_summary(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationSummary:
+        response = self.vertexai.generate_content(
+            **self._request(captions, cache_scope)
+        )
+
+        summary = ConversationSummary.model_validate_json(response.text)
+        return summary
+
+    async def get_summary_async(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> ConversationSummary:
+        response = await self.vertexai.generate_content_async(
+            **self._request(captions, cache_scope)
+        )
+
+        summary = ConversationSummary.model_validate_json(response.text)
+        return summary
+
+    def _request(self, captions: Captions, cache_scope: Optional[str]) -> dict:
+        return dict(
+            model=self.vertexai.model,
+            contents=[self._prompt()],
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
-                response_schema={
-                    "type": "object",
-                    "properties": {"summary": {"type": "string"}},
-                    "required": ["summary"],
-                },
+                response_schema=self.response_schema(),
             ),
+            context=[Part.from_text(self.renderer.render(captions).text)],
+            cache_scope=cache_scope,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model)
-
-        summary = ConversationSummary.model_validate_json(response.text)
-        return summary
+    def response_schema(self) -> dict:
+        return {
+            "type": "object",
+            "properties": {"summary": {"type": "string"}},
+            "required": ["summary"],
+        }
 
     def _prompt(self) -> str:
         return (
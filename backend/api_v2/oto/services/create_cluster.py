@@ -32,7 +32,8 @@ class CreateClusterService:
             self._prompt(),
             Part.from_text(prompt),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate_content(
+            self.vertexai.model,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
@@ -88,8 +89,6 @@ class CreateClusterService:
             ),
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model)
-
         return TrendsAndMicroTrends.model_validate_json(response.text)
 
     def _create_cluster_prompt(self, topics: dict[int, list[TopicData]]) -> str:
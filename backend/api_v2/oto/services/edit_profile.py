@@ -4,29 +4,37 @@ from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationHighlights
 from oto.domain.user import UpdateUser
 from functools import lru_cache
+from typing import Optional
+from oto.services.transcript_prompt import (
+    TranscriptPromptRenderer,
+    get_transcript_prompt_renderer,
+)
 
 
 @lru_cache
 def get_edit_profile_service() -> "EditProfileService":
-    return EditProfileService(get_vertexai())
+    return EditProfileService(get_vertexai(), get_transcript_prompt_renderer())
 
 
 class EditProfileService:
-    def __init__(self, vertexai: VertexAI):
+    def __init__(self, vertexai: VertexAI, renderer: TranscriptPromptRenderer):
         self.vertexai = vertexai
+        self.renderer = renderer
 
     def edit_profile(
-        self, captions: Captions, current_profile: UpdateUser
+        self,
+        captions: Captions,
+        current_profile: UpdateUser,
+        cache_scope: Optional[str] = None,
     ) -> UpdateUser:
-        messages = [
-            "Last conversation:",
-            Part.from_text(captions.model_dump_json()),
-            "Current profile:",
-            Part.from_text(current_profile.model_dump_json()),
-            self._prompt(),
-        ]
-        response = self.vertexai.model.generate_content(
-            messages,
+        response = self.vertexai.generate_content(
+            self.vertexai.model,
+            [
+                "The transcript above is the last conversation.",
+                "Current profile:",
+                Part.from_text(current_profile.model_dump_json()),
+                self._prompt(),
+            ],
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
@@ -52,10 +60,10 @@ class EditProfileService:
                     ],
                 },
             ),
+            context=[Part.from_text(self.renderer.render(captions).text)],
+            cache_scope=cache_scope,
         )
 
-        self.vertexai.notify_response(response, self.vertexai.model)
-
         new_profile = UpdateUser.model_validate_json(response.text)
         return new_profile
 
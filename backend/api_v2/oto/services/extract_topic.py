@@ -4,25 +4,29 @@ from vertexai.language_models import TextEmbeddingInput
 from oto.domain.transcript import Captions
 from oto.domain.analysis import TopicDataList
 from functools import lru_cache
+from typing import Optional
+from oto.services.transcript_prompt import (
+    TranscriptPromptRenderer,
+    get_transcript_prompt_renderer,
+)
 
 
 @lru_cache
 def get_extract_topic_service() -> "ExtractTopicService":
-    return ExtractTopicService(get_vertexai())
+    return ExtractTopicService(get_vertexai(), get_transcript_prompt_renderer())
 
 
 class ExtractTopicService:
-    def __init__(self, vertexai: VertexAI):
+    def __init__(self, vertexai: VertexAI, renderer: TranscriptPromptRenderer):
         self.vertexai = vertexai
+        self.renderer = renderer
 
-    def extract_topics(self, captions: Captions) -> TopicDataList:
-        messages = [
-            Part.from_text(
-                "```" + captions.model_dump_json() + "\n```\n\n" + self._prompt()
-            ),
-        ]
-        response = self.vertexai.model.generate_content(
-            messages,
+    def extract_topics(
+        self, captions: Captions, cache_scope: Optional[str] = None
+    ) -> TopicDataList:
+        response = self.vertexai.generate_content(
+            self.vertexai.model,
+            [self._prompt()],
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
@@ -56,6 +60,8 @@ class ExtractTopicService:
                     },
                 },
             ),
+            context=[Part.from_text(self.renderer.render(captions).text)],
+            cache_scope=cache_scope,
         )
 
         topics = TopicDataList.model_validate_json(response.text)
@@ -71,8 +77,6 @@ class ExtractTopicService:
         for topic, embedding in zip(topics.root, embeddings):
             topic.embedding = embedding.values
 
-        self.vertexai.notify_response(response, self.vertexai.model)
-
         return topics
 
     def _prompt(self) -> str:
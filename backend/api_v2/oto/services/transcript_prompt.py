@@ -0,0 +1,171 @@
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from oto.domain.transcript import Captions
+from oto.environment import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_transcript_prompt_renderer() -> "TranscriptPromptRenderer":
+    settings = get_settings()
+    return TranscriptPromptRenderer(settings.prompt_token_budget)
+
+
+@dataclass
+class RenderedTranscript:
+    text: str
+    tokens: int
+    turns: int
+    dropped_turns: int
+    # versus the per word caption json, estimated without rendering it
+    saved_tokens: int
+
+
+@dataclass
+class _Turn:
+    start: float
+    speaker: str
+    text: str
+
+
+class TranscriptPromptRenderer:
+    """
+    renders captions as one `[start] speaker: text` line per speaker turn,
+    instead of the per word json, and keeps the result under a token budget
+    """
+
+    MIN_TURN_CHARS = 80
+    # what the caption json adds around each caption's fields
+    LEGACY_CAPTION_CHARS = len('{"timecode":"","speaker":"","caption":""},')
+
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+
+    def render(
+        self, captions: Captions, token_budget: int | None = None
+    ) -> RenderedTranscript:
+        header = self._header()
+        token_budget = (token_budget or self.token_budget) - self.estimate_tokens(
+            header
+        )
+        turns = self._merge_turns(captions)
+
+        lines = [self._line(turn) for turn in turns]
+        dropped_turns = 0
+        if self.estimate_tokens("\n".join(lines)) > token_budget:
+            lines, dropped_turns = self._fit(turns, token_budget)
+
+        text = header + "\n".join(lines)
+        tokens = self.estimate_tokens(text)
+        rendered = RenderedTranscript(
+            text=text,
+            tokens=tokens,
+            turns=len(turns),
+            dropped_turns=dropped_turns,
+            saved_tokens=self._legacy_tokens(captions, turns) - tokens,
+        )
+        logger.info(
+            "rendered transcript: %d tokens, %d saved, %d turns, %d dropped",
+            rendered.tokens,
+            rendered.saved_tokens,
+            rendered.turns,
+            rendered.dropped_turns,
+        )
+        return rendered
+
+    def estimate_tokens(self, text: str) -> int:
+        """
+        cheap local estimate, about 4 characters per token for latin text
+        and one token per character for CJK and other wide scripts
+        """
+        ascii_chars = sum(1 for c in text if c < "\u0080")
+        return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+    def _legacy_tokens(self, captions: Captions, turns: list[_Turn]) -> int:
+        """
+        the per word json as a sum of lengths: the turns already hold the text
+        of every caption, the rest is keys, timecodes and speakers
+        """
+        fields = sum(
+            self.LEGACY_CAPTION_CHARS + len(caption.timecode) + len(caption.speaker)
+            for caption in captions.root
+        )
+        return (fields + 3) // 4 + sum(self.estimate_tokens(t.text) for t in turns)
+
+    def _header(self) -> str:
+        return (
+            "Transcript (one line per speaker turn, `[start time] speaker: text`):\n"
+        )
+
+    def _merge_turns(self, captions: Captions) -> list[_Turn]:
+        turns: list[_Turn] = []
+        for caption in captions.root:
+            text = caption.caption.strip()
+            if not text:
+                continue
+            if turns and turns[-1].speaker == caption.speaker:
+                turns[-1].text += " " + text
+                continue
+            turns.append(
+                _Turn(
+                    start=self._start_seconds(caption.timecode),
+                    speaker=caption.speaker,
+                    text=text,
+                )
+            )
+        return turns
+
+    def _fit(self, turns: list[_Turn], token_budget: int) -> tuple[list[str], int]:
+        """
+        first shorten the longest turns, then drop evenly spaced turns
+        if even short turns do not fit
+        """
+        longest = max(len(turn.text) for turn in turns)
+        low, high = self.MIN_TURN_CHARS, longest
+        best = None
+        while low <= high:
+            cap = (low + high) // 2
+            lines = [self._line(turn, cap) for turn in turns]
+            if self.estimate_tokens("\n".join(lines)) <= token_budget:
+                best = lines
+                low = cap + 1
+            else:
+                high = cap - 1
+        if best is not None:
+            return best, 0
+
+        lines = [self._line(turn, self.MIN_TURN_CHARS) for turn in turns]
+        tokens_per_line = self.estimate_tokens("\n".join(lines)) / len(lines)
+        keep = max(1, int(token_budget / tokens_per_line))
+        step = len(lines) / keep
+        kept = [lines[int(i * step)] for i in range(keep)]
+        return kept, len(lines) - keep
+
+    def _line(self, turn: _Turn, max_chars: int | None = None) -> str:
+        text = turn.text
+        if max_chars is not None and len(text) > max_chars:
+            text = text[:max_chars].rstrip() + "…"
+        return f"[{self._compact_timecode(turn.start)}] {turn.speaker}: {text}"
+
+    def _compact_timecode(self, seconds: float) -> str:
+        """
+        M:SS, or H:MM:SS once the recording passes an hour
+        """
+        seconds = int(seconds)
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{seconds:02d}"
+        return f"{minutes}:{seconds:02d}"
+
+    def _start_seconds(self, timecode: str) -> float:
+        start = timecode.split("-")[0].strip()
+        total = 0.0
+        try:
+            for part in start.split(":"):
+                total = total * 60 + float(part)
+        except ValueError:
+            return 0.0
+        return total
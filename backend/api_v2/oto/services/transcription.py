@@ -23,7 +23,8 @@ class TranscriptionService:
                 uri=f"gs://{self.bucket_name}/{audio_file_path}", mime_type=mime_type
             ),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate_content(
+            self.vertexai.model,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
@@ -0,0 +1,233 @@
+from collections import Counter
+from dataclasses import dataclass
+from oto.domain.fireworks import FireworksTranscriptionResponse, Word, Segment
+
+
+@dataclass
+class AudioWindow:
+    """
+    a slice of the source audio, in seconds.
+    `keep_start` / `keep_end` is the part owned by this window,
+    `start` / `end` also include the overlap shared with the neighbours.
+    """
+
+    start: float
+    end: float
+    keep_start: float
+    keep_end: float
+
+
+def plan_windows(
+    duration: float,
+    silences: list[tuple[float, float]],
+    window_seconds: float,
+    overlap_seconds: float = 5,
+    search_seconds: float = 30,
+) -> list[AudioWindow]:
+    """
+    split `duration` seconds of audio into windows of about `window_seconds`,
+    cutting in the middle of the nearest of the `silences` around every target cut.
+    """
+    if duration <= window_seconds:
+        return [AudioWindow(0, duration, 0, duration)]
+
+    cuts: list[float] = []
+    previous_cut = 0.0
+    while duration - previous_cut > window_seconds:
+        target = previous_cut + window_seconds
+        search_start = max(previous_cut + window_seconds / 2, target - search_seconds)
+        search_end = min(duration, target + search_seconds)
+        cut = _find_silence_cut(silences, search_start, search_end, target)
+        cuts.append(cut)
+        previous_cut = cut
+
+    boundaries = [0.0] + cuts + [duration]
+    windows = []
+    for keep_start, keep_end in zip(boundaries[:-1], boundaries[1:]):
+        windows.append(
+            AudioWindow(
+                start=max(0.0, keep_start - overlap_seconds),
+                end=min(duration, keep_end + overlap_seconds),
+                keep_start=keep_start,
+                keep_end=keep_end,
+            )
+        )
+    return windows
+
+
+def _find_silence_cut(
+    silences: list[tuple[float, float]],
+    search_start: float,
+    search_end: float,
+    target: float,
+) -> float:
+    # the part of each silence inside the search range
+    midpoints = [
+        (max(start, search_start) + min(end, search_end)) / 2
+        for start, end in silences
+        if start < search_end and end > search_start
+    ]
+    if not midpoints:
+        # no pause found, cut where we wanted to
+        return target
+    return min(midpoints, key=lambda midpoint: abs(midpoint - target))
+
+
+def stitch_responses(
+    windows: list[AudioWindow],
+    responses: list[FireworksTranscriptionResponse],
+) -> FireworksTranscriptionResponse:
+    """
+    merge per-window responses into one, as if the whole file was transcribed at once.
+    times are shifted back to the source timeline and speakers are matched
+    through the words both neighbouring windows heard in their overlap.
+    """
+    words: list[Word] = []
+    segments: list[Segment] = []
+    languages: list[str] = []
+    texts: list[str] = []
+    previous_words: list[Word] = []
+    used_speakers: set[str] = set()
+
+    for window, response in zip(windows, responses):
+        shifted_words = [_shift_word(word, window.start) for word in response.words]
+        speaker_map = _match_speakers(previous_words, shifted_words, used_speakers)
+        used_speakers.update(speaker_map.values())
+
+        for word in shifted_words:
+            word.speaker_id = speaker_map[word.speaker_id]
+        previous_words = shifted_words
+
+        kept_words = [word for word in shifted_words if _owns(window, word.start)]
+        words.extend(kept_words)
+
+        for segment in response.segments:
+            segment = _shift_segment(segment, window.start, speaker_map)
+            if not _owns(window, segment.start):
+                continue
+            segment.id = len(segments)
+            segment.words = [
+                word for word in segment.words if _owns(window, word.start)
+            ]
+            segments.append(segment)
+            texts.append(segment.text.strip())
+
+        for language in response.language.split(","):
+            language = language.strip()
+            if language and language not in languages:
+                languages.append(language)
+
+    return FireworksTranscriptionResponse(
+        task=responses[0].task,
+        language=",".join(languages),
+        text=" ".join(texts),
+        words=words,
+        segments=segments,
+        duration=windows[-1].end,
+    )
+
+
+def _owns(window: AudioWindow, start: float) -> bool:
+    # the last window also owns anything at its very end
+    if start == window.keep_end and window.keep_end == window.end:
+        return True
+    return window.keep_start <= start < window.keep_end
+
+
+def _shift_word(word: Word, offset: float) -> Word:
+    return word.model_copy(
+        update={"start": word.start + offset, "end": word.end + offset}
+    )
+
+
+def _shift_segment(
+    segment: Segment, offset: float, speaker_map: dict[str, str]
+) -> Segment:
+    return segment.model_copy(
+        update={
+            "start": segment.start + offset,
+            "end": segment.end + offset,
+            "audio_start": segment.audio_start + offset,
+            "audio_end": segment.audio_end + offset,
+            "speaker_id": speaker_map.get(segment.speaker_id, segment.speaker_id),
+            "words": [
+                _shift_word(word, offset).model_copy(
+                    update={
+                        "speaker_id": speaker_map.get(
+                            word.speaker_id, word.speaker_id
+                        )
+                    }
+                )
+                for word in segment.words
+            ],
+        }
+    )
+
+
+def _match_speakers(
+    previous_words: list[Word],
+    words: list[Word],
+    used_speakers: set[str],
+    tolerance_seconds: float = 0.3,
+) -> dict[str, str]:
+    """
+    map the speaker ids of this window onto the ids already in use,
+    voting with the words that both windows transcribed in the overlap.
+    """
+    votes: dict[str, Counter] = {}
+    if previous_words:
+        overlap_end = previous_words[-1].end
+        i = 0
+        for word in words:
+            if word.start > overlap_end:
+                break
+            while (
+                i < len(previous_words)
+                and previous_words[i].start < word.start - tolerance_seconds
+            ):
+                i += 1
+            j = i
+            while (
+                j < len(previous_words)
+                and previous_words[j].start <= word.start + tolerance_seconds
+            ):
+                if _normalize(previous_words[j].word) == _normalize(word.word):
+                    votes.setdefault(word.speaker_id, Counter())[
+                        previous_words[j].speaker_id
+                    ] += 1
+                    break
+                j += 1
+
+    speaker_map: dict[str, str] = {}
+    taken: set[str] = set()
+    # strongest matches first so two local speakers can't claim the same id
+    ranked = sorted(
+        (
+            (count, local, global_id)
+            for local, counter in votes.items()
+            for global_id, count in counter.items()
+        ),
+        reverse=True,
+    )
+    for _, local, global_id in ranked:
+        if local in speaker_map or global_id in taken:
+            continue
+        speaker_map[local] = global_id
+        taken.add(global_id)
+
+    for word in words:
+        local = word.speaker_id
+        if local in speaker_map:
+            continue
+        candidate = local
+        suffix = 1
+        while candidate in used_speakers or candidate in taken:
+            candidate = f"{local}_{suffix}"
+            suffix += 1
+        speaker_map[local] = candidate
+        taken.add(candidate)
+    return speaker_map
+
+
+def _normalize(word: str) -> str:
+    return "".join(c for c in word.lower() if c.isalnum())
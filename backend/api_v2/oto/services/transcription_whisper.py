@@ -1,55 +1,125 @@
+import contextvars
+import logging
+import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from vertexai.generative_models import Part, GenerationConfig
-from oto.domain.transcript import Captions, Caption
+from oto.domain.transcript import TranscriptColumns
+from oto.domain.fireworks import FireworksTranscriptionResponse
 from functools import lru_cache
 from oto.environment import get_settings
-from oto.infra.storage import get_storage
+from oto.infra.scratch import ScratchCache, get_scratch_cache
 from oto.infra.fireworks import Fireworks, get_fireworks
+from oto.infra import ffmpeg
+from oto.services.transcription_chunking import (
+    AudioWindow,
+    plan_windows,
+    stitch_responses,
+)
+
+logger = logging.getLogger(__name__)
 
 
 @lru_cache
 def get_transcription_service() -> "TranscriptionService":
-    return TranscriptionService(get_fireworks())
+    settings = get_settings()
+    return TranscriptionService(
+        get_fireworks(),
+        chunked=settings.transcription_chunked,
+        chunk_seconds=settings.transcription_chunk_seconds,
+        chunk_concurrency=settings.transcription_chunk_concurrency,
+    )
 
 
 class TranscriptionService:
-    def __init__(self, fireworks: Fireworks):
+    # pauses are this much quieter than the mean loudness, for at least this long
+    SILENCE_THRESH_OFFSET_DB = 16
+    MIN_SILENCE_MS = 400
+
+    def __init__(
+        self,
+        fireworks: Fireworks,
+        chunked: bool = False,
+        chunk_seconds: float = 600,
+        chunk_concurrency: int = 4,
+    ):
         self.fireworks = fireworks
-        self.storage = get_storage()
+        self.scratch: ScratchCache = get_scratch_cache()
+        self.chunked = chunked
+        self.chunk_seconds = chunk_seconds
+        self.chunk_concurrency = chunk_concurrency
 
     def transcribe(
         self, audio_file_path: str, mime_type: str
-    ) -> tuple[Captions, float]:
-        with self.storage.open_for_read(audio_file_path) as f:
-            response = self.fireworks.transcribe(f)
-
-            captions = []
-
-            total_active_seconds = 0
-
-            for segment in response.segments:
-                if segment.no_speech:
-                    continue
-                total_active_seconds += segment.end - segment.start
-
-            for word in response.words:
-                captions.append(
-                    Caption(
-                        timecode=self._seconds_to_timecode(word.start)
-                        + "-"
-                        + self._seconds_to_timecode(word.end),
-                        speaker=word.speaker_id,
-                        caption=word.word,
-                    )
+    ) -> tuple[TranscriptColumns, float]:
+        if self.chunked:
+            response = self._transcribe_chunked(audio_file_path)
+        else:
+            with self.scratch.open(audio_file_path) as f:
+                # a memory map has no name, the extension tells the format
+                response = self.fireworks.transcribe(
+                    f, os.path.basename(audio_file_path)
                 )
 
-            return Captions(captions), total_active_seconds
+        columns = TranscriptColumns()
+
+        total_active_seconds = 0
+
+        for segment in response.segments:
+            if segment.no_speech:
+                continue
+            total_active_seconds += segment.end - segment.start
+
+        for word in response.words:
+            columns.append(word.word, word.start, word.end, word.speaker_id)
 
-    def _seconds_to_timecode(self, seconds: float) -> str:
+        return columns, total_active_seconds
+
+    def _transcribe_chunked(
+        self, audio_file_path: str
+    ) -> FireworksTranscriptionResponse:
         """
-        make seconds to HH:MM:SS
+        split the audio at pauses and transcribe the windows in parallel,
+        so long recordings take about as long as a single window.
+        ffmpeg streams the file to find the pauses and seeks to cut each window,
+        the audio is never decoded into memory as a whole.
         """
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        with self.scratch.fetch(audio_file_path) as path:
+            duration = ffmpeg.probe_duration(path)
+            if duration <= self.chunk_seconds:
+                # the original as it is, there is nothing to cut
+                with open(path, "rb") as f:
+                    return self.fireworks.transcribe(
+                        f, os.path.basename(audio_file_path)
+                    )
+
+            silences = ffmpeg.detect_silences(
+                path,
+                ffmpeg.mean_volume(path) - self.SILENCE_THRESH_OFFSET_DB,
+                self.MIN_SILENCE_MS,
+            )
+            windows = plan_windows(duration, silences, self.chunk_seconds)
+            logger.info(
+                "Transcribing %d windows of %.0fs audio", len(windows), duration
+            )
+            with ThreadPoolExecutor(max_workers=self.chunk_concurrency) as executor:
+                # carry the usage attribution of the caller into the pool
+                responses = list(
+                    executor.map(
+                        lambda window: contextvars.copy_context().run(
+                            self._transcribe_window, path, window
+                        ),
+                        windows,
+                    )
+                )
+            return stitch_responses(windows, responses)
+
+    def _transcribe_window(
+        self, path: str, window: AudioWindow
+    ) -> FireworksTranscriptionResponse:
+        bytes_io = BytesIO(ffmpeg.cut(path, window.start, window.end, "flac"))
+        try:
+            return self.fireworks.transcribe(bytes_io, "window.flac")
+        finally:
+            bytes_io.close()
@@ -0,0 +1,81 @@
+from typing import Optional
+from sqlmodel import select, delete
+from oto.infra.database import create_db_session
+from oto.domain.checkpoint import StageCheckpoint
+from oto.domain.transcript import Transcript
+from oto.domain.analysis import ConversationAnalysis, Topic
+from oto.domain.point import PointTransaction
+from oto.domain.clip import Clip
+
+ANALYSIS_FIELDS = ["summary_dump", "highlights_dump", "insights_dump", "breakdown_dump"]
+
+
+def load_checkpoint(conversation_id: str, stage: str) -> Optional[StageCheckpoint]:
+    with create_db_session() as session:
+        return session.get(StageCheckpoint, (conversation_id, stage))
+
+
+def save_checkpoint(
+    conversation_id: str, stage: str, payload: Optional[str] = None
+) -> None:
+    with create_db_session() as session:
+        checkpoint = StageCheckpoint(
+            conversation_id=conversation_id, stage=stage, payload=payload
+        )
+        session.merge(checkpoint)
+        session.commit()
+
+
+def clear_checkpoints(conversation_id: str) -> None:
+    with create_db_session() as session:
+        session.exec(
+            delete(StageCheckpoint).where(
+                StageCheckpoint.conversation_id == conversation_id
+            )
+        )
+        session.commit()
+
+
+# stages that leave something behind are checked by what they left
+
+
+def transcript_stored(conversation_id: str) -> bool:
+    with create_db_session() as session:
+        return session.get(Transcript, conversation_id) is not None
+
+
+def analysis_stored(conversation_id: str, *fields: str) -> bool:
+    """
+    without fields, whether the analysis row exists at all
+    """
+    with create_db_session() as session:
+        analysis = session.get(ConversationAnalysis, conversation_id)
+    if not analysis:
+        return False
+    return all(getattr(analysis, field) for field in fields)
+
+
+def points_given(conversation_id: str) -> bool:
+    with create_db_session() as session:
+        return (
+            session.exec(
+                select(PointTransaction).where(
+                    PointTransaction.conversation_id == conversation_id
+                )
+            ).first()
+            is not None
+        )
+
+
+def topic_stored(conversation_id: str) -> bool:
+    with create_db_session() as session:
+        return session.get(Topic, conversation_id) is not None
+
+
+def clips_stored(conversation_id: str) -> bool:
+    with create_db_session() as session:
+        return (
+            session.exec(select(Clip).where(Clip.conversation_id == conversation_id))
+            .first()
+            is not None
+        )
@@ -5,13 +5,13 @@ from oto.services.content.clip import get_clip_generator_service
 from oto.services.content.clip_construct import get_clip_construct_service
 from oto.services.content.audio_enhancer import get_audio_enhancer_service
 from oto.infra.storage import get_storage
+from oto.infra.scratch import get_scratch_cache
 from oto.environment import get_settings
 
 # from oto.domain.clip import Clip
 # from sqlmodel import delete
 import pickle
 import os
-from io import BytesIO
 
 
 def create_clip_flow() -> None:
@@ -29,32 +29,43 @@ def create_clip_flow() -> None:
         pickle.dump(result, open("result.pkl", "wb"))
 
     storage = get_storage()
-    audio_file = storage.open_for_read(path)
+    with get_scratch_cache().fetch(path) as source_path:
+        clip_construct_service = get_clip_construct_service()
+        result = clip_construct_service.construct(source_path, result)
+        ext = clip_construct_service.intermediate_format
+        mime_type = clip_construct_service.mime_type
 
-    clip_construct_service = get_clip_construct_service()
-    result = clip_construct_service.construct(audio_file, result)
-
-    i = 0
-    for target_data in result.root:
-        print("Cleaning...")
-        cleaned_captions = clip_generator_service.pretty(target_data.audio, "audio/wav")
-        print("Cleaned captions", cleaned_captions)
-        audio_data, cleaned_captions = clip_construct_service.construct_with_captions(
-            BytesIO(target_data.audio), cleaned_captions
-        )
-        with open(f"output_{i}.wav", "wb") as f:
-            f.write(audio_data)
-        target_data.captions = cleaned_captions
-        target_data.audio = audio_data
-        path = storage.upload_bytes(audio_data, "clips", "wav", "audio/wav")
-        signed_url = storage.generate_signed_url(path)
-        print("enhancing...")
-        audio_enhancer_service = get_audio_enhancer_service()
-        bytes = audio_enhancer_service.enhance_audio(signed_url, "opus")
-        with open(f"output_{i}_enhanced.opus", "wb") as f:
-            f.write(bytes)
-        i += 1
-        break
+        i = 0
+        for target_data in result.root:
+            if not target_data.ranges:
+                continue
+            print("Cleaning...")
+            cleaned_captions = clip_generator_service.pretty(
+                target_data.audio, mime_type
+            )
+            print("Cleaned captions", cleaned_captions)
+            if not cleaned_captions.root:
+                continue
+            audio_data, cleaned_captions = (
+                clip_construct_service.construct_with_captions(
+                    source_path, target_data.ranges, cleaned_captions
+                )
+            )
+            if audio_data is None:
+                continue
+            with open(f"output_{i}.{ext}", "wb") as f:
+                f.write(audio_data)
+            target_data.captions = cleaned_captions
+            target_data.audio = audio_data
+            path = storage.upload_bytes(audio_data, "clips", ext, mime_type)
+            signed_url = storage.generate_signed_url(path)
+            print("enhancing...")
+            audio_enhancer_service = get_audio_enhancer_service()
+            bytes = audio_enhancer_service.enhance_audio(signed_url, "opus")
+            with open(f"output_{i}_enhanced.opus", "wb") as f:
+                f.write(bytes)
+            i += 1
+            break
 
     # with create_db_session() as session:
     #     session.exec(delete(Clip))
@@ -1,14 +1,26 @@
-from prefect import task, get_run_logger
+import contextvars
+import json
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Optional
+from prefect import task
+from oto.tasks.log import get_logger
 from oto.infra.database import create_db_session
 from oto.services.content.clip import get_clip_generator_service
 from oto.services.content.clip_construct import get_clip_construct_service
+from oto.services.content.caption_remap import get_caption_remapper
 from oto.services.content.audio_enhancer import get_audio_enhancer_service
 from oto.services.content.text_to_speech import get_text_to_speech_service
 from oto.infra.storage import get_storage
-from oto.domain.clip import Clip, ClipData
+from oto.environment import get_settings
+from oto.infra.scratch import get_scratch_cache
+from oto.infra.usage import usage_stage
+from oto.domain.clip import Clip, ClipData, ClipDatas, ClipCaptions
+from oto.tasks.checkpoint import load_checkpoint, save_checkpoint, clips_stored
 from oto.domain.conversation import Conversation
+from oto.domain.analysis import ConversationHighlights
+from oto.domain.transcript import TranscriptColumns
+from oto.tasks.conversation.context import get_conversation_context
 from sqlmodel import select
-from io import BytesIO
 
 
 def get_conversation(conversation_id: str) -> Conversation:
@@ -18,99 +30,237 @@ def get_conversation(conversation_id: str) -> Conversation:
         ).first()
 
 
+def prepare_clip(
+    conversation: Conversation,
+    i: int,
+    target_data: ClipData,
+    columns: Optional[TranscriptColumns] = None,
+) -> Optional[tuple[bytes, ClipCaptions, Future]]:
+    """
+    cleans one constructed clip and submits it for enhancement.
+    with the word timings in `columns`, captions are remapped from them locally.
+    None when nothing is left of the clip once cleaned.
+    """
+    conversation_id = conversation.id
+    clip_construct_service = get_clip_construct_service()
+    if not columns:
+        checkpoint = load_checkpoint(conversation_id, f"clip_pretty_{i}")
+        if checkpoint:
+            cleaned_captions = ClipCaptions.model_validate_json(checkpoint.payload)
+        else:
+            with usage_stage("clip_pretty", conversation_id):
+                cleaned_captions = get_clip_generator_service().pretty(
+                    target_data.audio, clip_construct_service.mime_type
+                )
+            save_checkpoint(
+                conversation_id,
+                f"clip_pretty_{i}",
+                cleaned_captions.model_dump_json(),
+            )
+        if not cleaned_captions.root:
+            return None
+    with get_scratch_cache().fetch(conversation.file_path) as source_path:
+        if columns:
+            pieces, cleaned_captions = get_caption_remapper().remap(
+                columns, target_data.ranges
+            )
+            if not pieces or not cleaned_captions.root:
+                return None
+            audio_data = clip_construct_service.extract(source_path, pieces)
+        else:
+            audio_data, cleaned_captions = (
+                clip_construct_service.construct_with_captions(
+                    source_path, target_data.ranges, cleaned_captions
+                )
+            )
+            if audio_data is None:
+                return None
+
+    storage = get_storage()
+    intermediate_path = storage.upload_bytes(
+        audio_data,
+        f"clips/{conversation.user_id}",
+        clip_construct_service.intermediate_format,
+        clip_construct_service.mime_type,
+    )
+    signed_url = storage.generate_signed_url(intermediate_path)
+    with usage_stage("clip_enhance", conversation_id):
+        enhanced = get_audio_enhancer_service().submit(
+            signed_url, "opus", audio=audio_data
+        )
+    return audio_data, cleaned_captions, enhanced
+
+
+def skip_clip(conversation_id: str, i: int) -> dict:
+    # recorded like an upload, so a resume does not try the clip again
+    upload = {"skipped": True}
+    save_checkpoint(conversation_id, f"clip_upload_{i}", json.dumps(upload))
+    return upload
+
+
+def upload_clip(
+    conversation: Conversation,
+    i: int,
+    target_data: ClipData,
+    prepared: tuple[bytes, ClipCaptions, Future],
+    comment_path: Future,
+) -> dict:
+    """
+    uploads one clip once enhanced, with its spoken comment
+    """
+    log = get_logger()
+    conversation_id = conversation.id
+    audio_data, cleaned_captions, enhanced = prepared
+    storage = get_storage()
+    try:
+        bytes = enhanced.result()
+    except Exception as e:
+        log.error("▶️ Enhancing audio failed: %s", e)
+        log.info("▶️ Enhancing audio failed, converting to opus instead")
+        if get_clip_construct_service().intermediate_format == "opus":
+            bytes = audio_data
+        else:
+            bytes = get_audio_enhancer_service().convert_to_opus(audio_data)
+    enhanced_path = storage.upload_bytes(
+        bytes,
+        f"clips/{conversation.user_id}",
+        "opus",
+        "audio/opus",
+    )
+    upload = {
+        "file_path": enhanced_path,
+        "comment_file_path": comment_path.result(),
+        "captions_dump": cleaned_captions.model_dump_json(),
+    }
+    save_checkpoint(conversation_id, f"clip_upload_{i}", json.dumps(upload))
+    return upload
+
+
 @task(task_run_name="create_clip")
 def create_clip_task(conversation_id: str) -> None:
-    log = get_run_logger()
+    """
+    generation, cleaning and each clip's uploads leave a checkpoint,
+    so a retry continues after the last step that finished
+    """
+    log = get_logger()
     log.info("▶️ Creating clips for conversation %s", conversation_id)
+    if clips_stored(conversation_id):
+        log.info("✅ Clips already created for conversation %s", conversation_id)
+        return
     conversation = get_conversation(conversation_id)
 
     path = conversation.file_path
     import_mime_type = conversation.mime_type
 
     clip_generator_service = get_clip_generator_service()
-    log.info("▶️ Generating clips for conversation %s", conversation_id)
-    result = clip_generator_service.generate(
-        path,
-        import_mime_type,
-    )
-    log.info("▶️ Generated clips for conversation %s", conversation_id)
-
-    storage = get_storage()
-    audio_file = storage.open_for_read(path)
+    checkpoint = load_checkpoint(conversation_id, "clip_generate")
+    if checkpoint:
+        log.info("▶️ Reusing generated clips for conversation %s", conversation_id)
+        result = ClipDatas.model_validate_json(checkpoint.payload)
+    else:
+        log.info("▶️ Generating clips for conversation %s", conversation_id)
+        context = get_conversation_context(conversation_id)
+        columns = None
+        if get_settings().clip_selection == "transcript":
+            columns = context.columns
+        with usage_stage("clip_generate", conversation_id):
+            if columns:
+                dump = context.analysis.highlights_dump
+                result = clip_generator_service.generate_from_transcript(
+                    columns,
+                    ConversationHighlights.model_validate_json(dump) if dump else None,
+                    cache_scope=conversation_id,
+                )
+            else:
+                result = clip_generator_service.generate(
+                    path,
+                    import_mime_type,
+                    cache_scope=conversation_id,
+                )
+        save_checkpoint(conversation_id, "clip_generate", result.model_dump_json())
+        log.info("▶️ Generated clips for conversation %s", conversation_id)
 
-    clip_construct_service = get_clip_construct_service()
-    result = clip_construct_service.construct(audio_file, result)
+    uploads: dict[int, dict] = {}
+    for i in range(len(result.root)):
+        checkpoint = load_checkpoint(conversation_id, f"clip_upload_{i}")
+        if checkpoint:
+            uploads[i] = json.loads(checkpoint.payload)
+    pending = [i for i in range(len(result.root)) if i not in uploads]
 
-    ret: list[ClipData] = []
+    columns = None
+    if pending and get_settings().clip_captions == "remap":
+        columns = get_conversation_context(conversation_id).columns
+    if pending:
+        clip_construct_service = get_clip_construct_service()
+        with get_scratch_cache().fetch(path) as source_path:
+            if columns:
+                # remapped captions need only the ranges, not the audio to listen to
+                result = clip_construct_service.plan(source_path, result)
+            else:
+                result = clip_construct_service.construct(source_path, result)
+    for i in [i for i in pending if not result.root[i].ranges]:
+        log.info("▶️ Skipping clip %s with nothing to cut", i)
+        uploads[i] = skip_clip(conversation_id, i)
+    pending = [i for i in pending if i not in uploads]
 
-    log.info("▶️ Cleaning clips for conversation %s", conversation_id)
-    for target_data in result.root:
-        cleaned_captions = clip_generator_service.pretty(target_data.audio, "audio/wav")
-        if cleaned_captions.root.count == 0:
-            continue
-        audio_data, cleaned_captions = clip_construct_service.construct_with_captions(
-            BytesIO(target_data.audio), cleaned_captions
+    log.info("▶️ Cleaning and uploading clips for conversation %s", conversation_id)
+    # every comment is spoken while the clips are cleaned and enhanced
+    text_to_speech_service = get_text_to_speech_service()
+    with usage_stage("clip_comment_tts", conversation_id):
+        comment_paths = text_to_speech_service.synthesize_all(
+            [result.root[i].comment for i in pending], conversation.user_id, "opus"
         )
-        target_data.captions = cleaned_captions
-        target_data.audio = audio_data
-        ret.append(target_data)
-    log.info("▶️ Cleaned clips for conversation %s", conversation_id)
 
-    with create_db_session() as session:
-        i = 0
-        log.info("▶️ Uploading clips for conversation %s", conversation_id)
-        for target_data in ret:
-            path = storage.upload_bytes(
-                target_data.audio,
-                f"clips/{conversation.user_id}",
-                "wav",
-                "audio/wav",
-            )
-            # enhance audio
-            signed_url = storage.generate_signed_url(path)
-            audio_enhancer_service = get_audio_enhancer_service()
-            try:
-                bytes = audio_enhancer_service.enhance_audio(signed_url, "opus")
-                enhanced_path = storage.upload_bytes(
-                    bytes,
-                    f"clips/{conversation.user_id}",
-                    "opus",
-                    "audio/opus",
-                )
-            except Exception as e:
-                log.error("▶️ Enhancing audio failed: %s", e)
-                log.info("▶️ Enhancing audio failed, converting to opus instead")
-                bytes = audio_enhancer_service.convert_to_opus(target_data.audio)
-                enhanced_path = storage.upload_bytes(
-                    bytes,
-                    f"clips/{conversation.user_id}",
-                    "opus",
-                    "audio/opus",
-                )
-            text_to_speech_service = get_text_to_speech_service()
-            tts_bytes = text_to_speech_service.generate(target_data.comment, "opus")
-            tts_path = storage.upload_bytes(
-                tts_bytes,
-                f"clip_comments/{conversation.user_id}",
-                "opus",
-                "audio/opus",
+    with ThreadPoolExecutor(get_settings().clip_concurrency) as pool:
+
+        def run(function, i: int, *args):
+            return pool.submit(
+                contextvars.copy_context().run,
+                function,
+                conversation,
+                i,
+                result.root[i],
+                *args,
             )
-            session.add(
+
+        # every clip is submitted for enhancement before any is waited on
+        prepared = {i: run(prepare_clip, i, columns) for i in pending}
+        wait(prepared.values())
+        uploaded = {
+            i: run(upload_clip, i, future.result(), comment_path)
+            for (i, future), comment_path in zip(prepared.items(), comment_paths)
+            if not future.exception() and future.result() is not None
+        }
+    # every clip has finished, or left its checkpoints, before one fails the task
+    for i in pending:
+        if i in uploaded:
+            uploads[i] = uploaded[i].result()
+        elif prepared[i].result() is None:
+            log.info("▶️ Skipping clip %s with empty captions", i)
+            uploads[i] = skip_clip(conversation_id, i)
+    log.info("▶️ Uploaded clips for conversation %s", conversation_id)
+
+    with create_db_session() as session:
+        # all clips at once, when every one of them is ready
+        session.add_all(
+            [
                 Clip(
                     user_id=conversation.user_id,
                     conversation_id=conversation.id,
                     file_name=f"clip_{i}.opus",
-                    file_path=enhanced_path,
+                    file_path=uploads[i]["file_path"],
                     mime_type="audio/opus",
                     comment_file_name=f"comment_{i}.opus",
-                    comment_file_path=tts_path,
+                    comment_file_path=uploads[i]["comment_file_path"],
                     comment_mime_type="audio/opus",
                     title=target_data.title,
                     description=target_data.description,
                     comment=target_data.comment,
-                    captions_dump=target_data.captions.model_dump_json(),
+                    captions_dump=uploads[i]["captions_dump"],
                 )
-            )
-        log.info("▶️ Uploaded clips for conversation %s", conversation_id)
+                for i, target_data in enumerate(result.root)
+                if not uploads[i].get("skipped")
+            ]
+        )
         session.commit()
     log.info("✅ Created clips for conversation %s", conversation_id)
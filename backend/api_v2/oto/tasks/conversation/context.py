@@ -0,0 +1,199 @@
+import threading
+from typing import Optional
+from sqlalchemy import update
+from oto.infra.database import create_db_session
+from oto.infra.progress import get_progress_hub
+from oto.domain.conversation import Conversation, ProcessingStatus
+from oto.domain.transcript import Transcript, TranscriptColumns, Captions
+from oto.domain.analysis import ConversationAnalysis, ConversationAnalysisData
+
+_contexts: dict[str, "ConversationContext"] = {}
+_contexts_lock = threading.Lock()
+
+
+def open_conversation_context(conversation_id: str) -> "ConversationContext":
+    """
+    shares one loaded conversation with every task of the flow run,
+    until close_conversation_context
+    """
+    context = ConversationContext(conversation_id)
+    with _contexts_lock:
+        _contexts[conversation_id] = context
+    return context
+
+
+def close_conversation_context(conversation_id: str) -> None:
+    """
+    writes whatever the tasks left buffered
+    """
+    with _contexts_lock:
+        context = _contexts.pop(conversation_id, None)
+    if context:
+        context.flush()
+
+
+def find_conversation_context(
+    conversation_id: str,
+) -> Optional["ConversationContext"]:
+    with _contexts_lock:
+        return _contexts.get(conversation_id)
+
+
+def get_conversation_context(conversation_id: str) -> "ConversationContext":
+    context = find_conversation_context(conversation_id)
+    if context:
+        return context
+    # the task runs on its own, outside a flow that opened a context
+    return ConversationContext(conversation_id, write_through=True)
+
+
+class ConversationContext:
+    """
+    the conversation, its captions and its analysis, loaded once and shared by
+    concurrent tasks. everything read from here is shared, so treat it as read
+    only and write through the methods. each analysis section is written as
+    soon as it is set, so a crash loses none that finished and a resume skips
+    them. the status is buffered until `flush` (immediately when
+    `write_through`).
+    """
+
+    def __init__(self, conversation_id: str, write_through: bool = False):
+        self.conversation_id = conversation_id
+        self.write_through = write_through
+        self._lock = threading.RLock()
+        with create_db_session() as session:
+            self.conversation = session.get(Conversation, conversation_id)
+        if not self.conversation:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        self._columns: Optional[TranscriptColumns] = None
+        self._captions: Optional[Captions] = None
+        self._analysis: Optional[ConversationAnalysis] = None
+        self._analysis_dirty = False
+        self._status: Optional[tuple[ProcessingStatus, str]] = None
+
+    @property
+    def user_id(self) -> str:
+        return self.conversation.user_id
+
+    @property
+    def captions(self) -> Captions:
+        """
+        speaker turns, parsed on first use. concurrent callers wait for
+        that parse instead of doing their own.
+        """
+        with self._lock:
+            if self._captions is None:
+                self._captions = self._load_captions()
+            return self._captions
+
+    def _load_captions(self) -> Captions:
+        if self._columns is not None:
+            return self._columns.to_captions("turn")
+        with create_db_session() as session:
+            transcript = session.get(Transcript, self.conversation_id)
+            if not transcript:
+                raise ValueError(f"Transcript {self.conversation_id} not found")
+            return transcript.get_captions("turn")
+
+    @property
+    def columns(self) -> Optional[TranscriptColumns]:
+        """
+        the word level transcript, None for legacy transcripts without timings
+        """
+        with self._lock:
+            if self._columns is None:
+                with create_db_session() as session:
+                    transcript = session.get(Transcript, self.conversation_id)
+                if transcript and transcript.columns_dump:
+                    self._columns = TranscriptColumns.unpack(transcript.columns_dump)
+            return self._columns
+
+    def set_transcript_columns(self, columns: TranscriptColumns) -> None:
+        """
+        hands over what the transcription stage just stored,
+        so the captions are built without reading it back
+        """
+        with self._lock:
+            self._columns = columns
+            self._captions = None
+
+    @property
+    def analysis(self) -> ConversationAnalysis:
+        with self._lock:
+            if self._analysis is None:
+                with create_db_session() as session:
+                    self._analysis = session.get(
+                        ConversationAnalysis, self.conversation_id
+                    )
+                if not self._analysis:
+                    self._analysis = self._empty_analysis()
+            return self._analysis
+
+    def _empty_analysis(self) -> ConversationAnalysis:
+        return ConversationAnalysis(id=self.conversation_id, user_id=self.user_id)
+
+    def reset_analysis(self) -> None:
+        with self._lock:
+            self._analysis = self._empty_analysis()
+            self._analysis_dirty = True
+        self.flush()
+
+    def update_analysis(self, **dumps: Optional[str]) -> None:
+        """
+        e.g. update_analysis(summary_dump=...)
+        """
+        with self._lock:
+            analysis = self.analysis
+            for name, dump in dumps.items():
+                setattr(analysis, name, dump)
+            self._analysis_dirty = True
+        # the stored section is what the resume checks read
+        self.flush()
+        hub = get_progress_hub()
+        for name, dump in dumps.items():
+            if dump is not None:
+                hub.publish_section(self.conversation_id, name.removesuffix("_dump"))
+
+    def set_analysis_data(self, data: ConversationAnalysisData) -> None:
+        self.update_analysis(
+            summary_dump=data.summary.model_dump_json(),
+            highlights_dump=data.highlights.model_dump_json(),
+            insights_dump=data.insights.model_dump_json(),
+            breakdown_dump=data.breakdown.model_dump_json(),
+        )
+
+    def set_status(self, status: ProcessingStatus, inner_status: str) -> None:
+        with self._lock:
+            self._status = (status, inner_status)
+        self._write_through()
+
+    def _write_through(self) -> None:
+        if self.write_through:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        writes the buffered analysis and status in one commit
+        """
+        with self._lock:
+            if not self._analysis_dirty and self._status is None:
+                return
+            status = self._status
+            with create_db_session() as session:
+                if self._analysis_dirty:
+                    session.merge(self._analysis)
+                if status is not None:
+                    # only the status columns, other stages write the rest
+                    session.execute(
+                        update(Conversation)
+                        .where(Conversation.id == self.conversation_id)
+                        .values(status=status[0], inner_status=status[1])
+                    )
+                session.commit()
+            self._analysis_dirty = False
+            self._status = None
+        if status is not None:
+            # once readable
+            get_progress_hub().publish_status(
+                self.conversation_id, status[0].value, status[1]
+            )
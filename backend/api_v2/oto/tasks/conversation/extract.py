@@ -1,55 +1,139 @@
+import queue
+import time
+from typing import Iterator
 from prefect import flow, task, get_run_logger
-from sqlmodel import select
+from prefect.futures import PrefectFuture
+from sqlmodel import select, func
 from prefect.task_runners import ConcurrentTaskRunner
 from oto.infra.database import create_db_session
 from oto.domain.conversation import Conversation
-from oto.domain.transcript import Transcript
-from oto.domain.transcript import Captions
 from oto.domain.analysis import Topic
 from oto.services.extract_topic import get_extract_topic_service
+from oto.infra.vertexai import get_vertexai
 from oto.domain.conversation import ProcessingStatus
+from oto.infra.usage import usage_stage
+from oto.tasks.conversation.context import get_conversation_context
 
 
 @task(task_run_name="extract_topic")
 def extract_topic(conversation_id: str) -> None:
+    context = get_conversation_context(conversation_id)
     with create_db_session() as session:
-        conversation = session.get(Conversation, conversation_id)
-        if not conversation:
-            raise ValueError(f"Conversation {conversation_id} not found")
-        transcript = session.get(Transcript, conversation.id)
-        if not transcript:
-            raise ValueError(f"Transcript {conversation.id} not found")
         topic = session.exec(select(Topic).where(Topic.id == conversation_id)).first()
         if topic:
             return
-        captions = Captions.model_validate_json(transcript.captions_dump)
         extract_topic_service = get_extract_topic_service()
-        topics = extract_topic_service.extract_topics(captions)
+        with usage_stage("extract_topic", conversation_id):
+            topics = extract_topic_service.extract_topics(
+                context.captions, conversation_id
+            )
         topic = Topic.from_topic_datas(topics)
         topic.id = conversation_id
-        topic.user_id = conversation.user_id
+        topic.user_id = context.user_id
         session.add(topic)
         session.commit()
 
 
 @flow(name="extract_topic", task_runner=ConcurrentTaskRunner())
 def extract_topic_flow(conversation_id: str) -> None:
-    extract_topic(conversation_id)
+    try:
+        extract_topic(conversation_id)
+    finally:
+        get_vertexai().evict_cached_contents(conversation_id)
+
+
+def missing_topic_query():
+    """
+    completed conversations without a topic yet
+    """
+    return (
+        select(Conversation.id)
+        .outerjoin(Topic, Topic.id == Conversation.id)
+        .where(Conversation.status == ProcessingStatus.COMPLETED, Topic.id.is_(None))
+    )
+
+
+def missing_topic_pages(page_size: int, after: str = "") -> Iterator[list[str]]:
+    """
+    pages by id, so topics written meanwhile don't shift the pages
+    """
+    while True:
+        with create_db_session() as session:
+            page = session.exec(
+                missing_topic_query()
+                .where(Conversation.id > after)
+                .order_by(Conversation.id)
+                .limit(page_size)
+            ).all()
+        if not page:
+            return
+        yield list(page)
+        after = page[-1]
 
 
 @flow(name="extract_topics_from_all_conversations", task_runner=ConcurrentTaskRunner())
-def extract_topics_from_all_conversations_flow() -> None:
+def extract_topics_from_all_conversations_flow(
+    concurrency: int = 4, page_size: int = 100, after: str = ""
+) -> None:
+    """
+    backfills topics of completed conversations that have none, `concurrency` at a
+    time. only missing ones are selected, so an interrupted run is resumed by
+    running it again (or from the last logged id with `after`).
+    """
     log = get_run_logger()
     with create_db_session() as session:
-        conversations = session.exec(
-            select(Conversation).where(
-                Conversation.status == ProcessingStatus.COMPLETED
+        total = session.exec(
+            select(func.count()).select_from(
+                missing_topic_query().where(Conversation.id > after).subquery()
             )
-        ).all()
-        for conversation in conversations:
-            log.info("Extracting topics from conversation %s", conversation.id)
-            try:
-                extract_topic.submit(conversation.id).result()
-            except Exception:
-                pass
-        log.info("Extracted topics from all conversations")
+        ).one()
+    log.info("Extracting topics from %d conversations", total)
+
+    started_at = time.monotonic()
+    finished: queue.Queue = queue.Queue()
+    in_flight: dict[PrefectFuture, str] = {}
+    succeeded = 0
+    failed = 0
+
+    def collect() -> None:
+        nonlocal succeeded, failed
+        future = finished.get()
+        conversation_id = in_flight.pop(future)
+        try:
+            future.result()
+            succeeded += 1
+        except Exception as e:
+            failed += 1
+            log.warning("Extracting topics from %s failed: %s", conversation_id, e)
+        finally:
+            get_vertexai().evict_cached_contents(conversation_id)
+
+    for page in missing_topic_pages(page_size, after):
+        for conversation_id in page:
+            while len(in_flight) >= concurrency:
+                collect()
+            future = extract_topic.submit(conversation_id)
+            in_flight[future] = conversation_id
+            future.add_done_callback(finished.put)
+
+        processed = succeeded + failed
+        elapsed = time.monotonic() - started_at
+        rate = processed / elapsed * 60 if elapsed else 0.0
+        log.info(
+            "Topics %d/%d (%d failed), %.1f/min, ETA %.0f min, submitted up to %s",
+            processed,
+            total,
+            failed,
+            rate,
+            (total - processed) / rate if rate else -1,
+            page[-1],
+        )
+
+    while in_flight:
+        collect()
+    log.info(
+        "Extracted topics from %d conversations (%d failed) in %.0fs",
+        succeeded,
+        failed,
+        time.monotonic() - started_at,
+    )
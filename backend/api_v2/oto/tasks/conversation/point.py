@@ -12,6 +12,15 @@ def give_points_to_user(conversation_id: str) -> None:
         if not conversation:
             raise ValueError(f"Conversation {conversation_id} not found")
 
+        given = session.exec(
+            select(PointTransaction).where(
+                PointTransaction.conversation_id == conversation_id
+            )
+        ).first()
+        if given:
+            # already paid out by an earlier run
+            return
+
         acquired_points = conversation.points
 
         points = session.exec(
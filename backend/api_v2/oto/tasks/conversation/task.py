@@ -1,4 +1,4 @@
-from prefect import flow, get_run_logger
+from prefect import flow
 from prefect.task_runners import ConcurrentTaskRunner
 from .analysis import (
     generate_empty_analysis,
@@ -6,6 +6,8 @@ from .analysis import (
     generate_highlights,
     generate_insights,
     generate_breakdown,
+    generate_fused_analysis,
+    generate_analysis_async,
     complete_analysis,
     mark_as_failed,
     edit_profile,
@@ -15,70 +17,217 @@ from .transcribe import transcribe_conversation
 from .point import give_points_to_user
 from .extract import extract_topic
 from oto.services.safety import check_conversation_limit_exceeded
+from oto.environment import get_settings
+from oto.infra.vertexai import get_vertexai
+from oto.infra.admission import get_conversation_admission, estimate_audio_minutes
+from oto.infra.storage import get_storage
+from oto.infra.scratch import get_scratch_cache
+from oto.tasks.dag import Stage, StageGraph, SubmitTask, submit_to_prefect
+from oto.tasks.log import get_logger
+from .context import open_conversation_context, close_conversation_context
+from oto.domain.conversation import ProcessingStatus
+from oto.tasks.checkpoint import (
+    ANALYSIS_FIELDS,
+    load_checkpoint,
+    transcript_stored,
+    analysis_stored,
+    points_given,
+    topic_stored,
+    clips_stored,
+)
+
+
+def conversation_stages(
+    conversation_id: str, resume: bool = False, submit: SubmitTask = submit_to_prefect
+) -> list[Stage]:
+    """
+    with `resume`, stages that already finished in an earlier run are skipped
+    """
+    settings = get_settings()
+    ready = ["transcribe", "empty_analysis"]
+
+    stages = [
+        Stage(
+            "clip",
+            lambda _: submit(create_clip_task, conversation_id),
+            critical=False,
+        ),
+        Stage("transcribe", lambda _: submit(transcribe_conversation, conversation_id)),
+        Stage(
+            "empty_analysis", lambda _: submit(generate_empty_analysis, conversation_id)
+        ),
+        Stage(
+            "edit_profile",
+            lambda _: submit(edit_profile, conversation_id),
+            needs=["transcribe"],
+        ),
+        Stage(
+            "points",
+            lambda _: submit(give_points_to_user, conversation_id),
+            needs=["transcribe"],
+        ),
+        Stage(
+            "extract_topic",
+            lambda _: submit(extract_topic, conversation_id),
+            needs=["transcribe"],
+            critical=False,
+        ),
+    ]
+
+    def sections(_) -> list:
+        if settings.async_analysis:
+            return [submit(generate_analysis_async, conversation_id)]
+        return [
+            submit(generate_summary, conversation_id),
+            submit(generate_highlights, conversation_id),
+            submit(generate_insights, conversation_id),
+            submit(generate_breakdown, conversation_id),
+        ]
+
+    if settings.fused_analysis:
+        stages += [
+            Stage(
+                "fused_analysis",
+                lambda _: submit(generate_fused_analysis, conversation_id),
+                needs=ready,
+            ),
+            # runs the sections only when the fused response was invalid
+            Stage(
+                "analysis",
+                lambda done: None if done["fused_analysis"] else sections(done),
+                needs=["fused_analysis"],
+            ),
+        ]
+    elif settings.async_analysis:
+        stages.append(Stage("analysis", sections, needs=ready))
+    else:
+        for name, section in [
+            ("summary", generate_summary),
+            ("highlights", generate_highlights),
+            ("insights", generate_insights),
+            ("breakdown", generate_breakdown),
+        ]:
+            stages.append(
+                Stage(
+                    name,
+                    lambda _, section=section: submit(section, conversation_id),
+                    needs=ready,
+                )
+            )
+
+    analysis = [
+        stage.name
+        for stage in stages
+        if stage.name not in ("clip", "extract_topic", *ready)
+    ]
+    if settings.clip_selection == "transcript":
+        # clips are picked from the transcript and the highlights
+        by_name = {stage.name: stage for stage in stages}
+        by_name["clip"].needs = [
+            "transcribe",
+            "highlights" if "highlights" in by_name else "analysis",
+        ]
+    stages.append(
+        Stage(
+            "complete",
+            lambda _: submit(complete_analysis, conversation_id),
+            needs=analysis,
+        )
+    )
+
+    if resume:
+        checks = {
+            "clip": lambda: clips_stored(conversation_id),
+            "transcribe": lambda: transcript_stored(conversation_id),
+            "empty_analysis": lambda: analysis_stored(conversation_id),
+            "edit_profile": lambda: (
+                load_checkpoint(conversation_id, "edit_profile") is not None
+            ),
+            "points": lambda: points_given(conversation_id),
+            "extract_topic": lambda: topic_stored(conversation_id),
+            "summary": lambda: analysis_stored(conversation_id, "summary_dump"),
+            "highlights": lambda: analysis_stored(conversation_id, "highlights_dump"),
+            "insights": lambda: analysis_stored(conversation_id, "insights_dump"),
+            "breakdown": lambda: analysis_stored(conversation_id, "breakdown_dump"),
+        }
+        checks["fused_analysis"] = checks["analysis"] = lambda: analysis_stored(
+            conversation_id, *ANALYSIS_FIELDS
+        )
+        for stage in stages:
+            stage.done = checks.get(stage.name)
+    return stages
 
 
 @flow(
     name="process_conversation",
     task_runner=ConcurrentTaskRunner(),
-    timeout_seconds=60 * 20,  # 20 minutes
+    # 20 minutes of processing, the rest for waiting to be admitted
+    timeout_seconds=60 * 40,
 )
 def process_conversation_flow(conversation_id: str):
-    log = get_run_logger()
-    try:
-        log.info("▶️ Processing conversation %s", conversation_id)
-
-        check_conversation_limit_exceeded()
-
-        # start create clip
-        clip_task = create_clip_task.submit(conversation_id)
-
-        # 1. Transcribe conversation
-        transcribe_conversation.submit(conversation_id).result()
-
-        log.info("📝 Transcription complete — starting analysis")
+    run_conversation_stages(conversation_id)
 
-        generate_empty_analysis.submit(conversation_id).result()
 
-        log.info("🔍 Analysis complete — starting summary")
-
-        # 2. Generate analysis
-        futures = [
-            generate_summary.submit(conversation_id),
-            generate_highlights.submit(conversation_id),
-            generate_insights.submit(conversation_id),
-        ]
-
-        # 3. Wait for all analysis tasks to complete
-        for f in futures:
-            f.result()
-
-        # 4. Generate analysis (2)
-        futures = [
-            generate_breakdown.submit(conversation_id),
-            edit_profile.submit(conversation_id),
-        ]
-
-        # 5. Wait for all analysis tasks to complete
-        for f in futures:
-            f.result()
+@flow(
+    name="resume_conversation",
+    task_runner=ConcurrentTaskRunner(),
+    timeout_seconds=60 * 40,
+)
+def resume_conversation_flow(conversation_id: str):
+    """
+    after a failed run, reruns only the stages that did not finish
+    """
+    run_conversation_stages(conversation_id, resume=True)
+
+
+def run_conversation_stages(
+    conversation_id: str, resume: bool = False, submit: SubmitTask = submit_to_prefect
+) -> None:
+    """
+    the body of the conversation flows, `submit` decides where the tasks run
+    """
+    log = get_logger()
+    try:
+        log.info(
+            "▶️ %s conversation %s",
+            "Resuming" if resume else "Processing",
+            conversation_id,
+        )
 
-        # 6. Give points to user
-        give_points_to_user.submit(conversation_id).result()
+        check_conversation_limit_exceeded()
 
-        # 7. Complete analysis
-        complete_analysis.submit(conversation_id).result()
+        # loaded once here, shared by every task below
+        context = open_conversation_context(conversation_id)
+        conversation = context.conversation
+        if resume:
+            context.set_status(ProcessingStatus.PROCESSING, "Resuming")
+            context.flush()
+
+        estimated_minutes = estimate_audio_minutes(
+            get_storage().get_size(conversation.file_path), conversation.mime_type
+        )
+        admission = get_conversation_admission()
+        # the stages share one local copy of the audio, kept until they finish
+        with admission.admit(
+            conversation_id, conversation.user_id, estimated_minutes
+        ) as ticket, get_scratch_cache().hold(conversation.file_path):
+            log.info(
+                "🎟️ Admitted after %.0fs (~%.0f min of audio)",
+                ticket.wait_seconds,
+                estimated_minutes,
+            )
+            # every stage starts as soon as the stages it needs are done
+            stages = conversation_stages(conversation_id, resume, submit)
+            report = StageGraph(stages).run()
         log.info("✅ Analysis complete")
 
-        try:
-            extract_topic.submit(conversation_id).result()
-        except Exception as e:
-            log.exception("❌ Error extracting topic but it's not critical", exc_info=e)
-
-        try:
-            clip_task.result()
-        except Exception as e:
-            log.exception("❌ Error creating clip but it's not critical", exc_info=e)
+        for name, error in report.errors.items():
+            log.error("❌ Error in %s but it's not critical", name, exc_info=error)
+        log.info("⏱️ Stages\n%s", report.format())
     except Exception:
         log.exception("❌ Error processing conversation")
-        mark_as_failed.submit(conversation_id)
+        submit(mark_as_failed, conversation_id)
         raise
+    finally:
+        close_conversation_context(conversation_id)
+        get_vertexai().evict_cached_contents(conversation_id)
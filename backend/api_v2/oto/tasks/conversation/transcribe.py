@@ -5,6 +5,9 @@ from oto.domain.conversation import Conversation, ProcessingStatus
 from oto.domain.transcript import Transcript
 from oto.services.transcription_whisper import get_transcription_service
 from oto.domain.point import Point, PointTransaction
+from oto.infra.usage import usage_stage
+from oto.infra.progress import get_progress_hub
+from oto.tasks.conversation.context import find_conversation_context
 
 
 @task(task_run_name="transcribe_conversation")
@@ -13,23 +16,31 @@ def transcribe_conversation(conversation_id: str) -> None:
         conversation = session.get(Conversation, conversation_id)
         if not conversation:
             raise ValueError(f"Conversation {conversation_id} not found")
+        if session.get(Transcript, conversation_id):
+            # transcribed by an earlier run
+            return
 
         conversation.status = ProcessingStatus.PROCESSING
         conversation.inner_status = "Transcribing conversation"
         session.add(conversation)
         session.commit()
+        hub = get_progress_hub()
+        hub.publish_status(
+            conversation_id, conversation.status.value, conversation.inner_status
+        )
 
         transcription_service = get_transcription_service()
-        result, total_active_seconds = transcription_service.transcribe(
-            conversation.file_path, conversation.mime_type
-        )
+        with usage_stage("transcribe", conversation_id):
+            result, total_active_seconds = transcription_service.transcribe(
+                conversation.file_path, conversation.mime_type
+            )
 
         acquired_points = round(total_active_seconds / 60 / 60 * 200, 1)
 
         transcript = Transcript(
             id=conversation_id,
             user_id=conversation.user_id,
-            captions_dump=result.model_dump_json(),
+            columns_dump=result.pack(),
         )
         session.add(transcript)
 
@@ -38,3 +49,10 @@ def transcribe_conversation(conversation_id: str) -> None:
         conversation.points = acquired_points
         session.add(conversation)
         session.commit()
+        hub.publish_status(
+            conversation_id, conversation.status.value, conversation.inner_status
+        )
+
+    context = find_conversation_context(conversation_id)
+    if context:
+        context.set_transcript_columns(result)
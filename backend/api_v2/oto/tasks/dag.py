@@ -0,0 +1,232 @@
+import queue
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Union
+from prefect.futures import PrefectFuture
+
+# prefect futures, or concurrent ones when running without prefect
+Submitted = Union[PrefectFuture, Future, list, None]
+SubmitTask = Callable[..., Union[PrefectFuture, Future]]
+
+
+def submit_to_prefect(task, *args) -> PrefectFuture:
+    return task.submit(*args)
+
+
+@dataclass
+class Stage:
+    """
+    `submit` receives the results of the stages in `needs` and returns the
+    futures it started, or None when there is nothing to run.
+    a failing stage that is not `critical` only skips the stages that need it.
+    when `done` says the stage already finished in an earlier run, it is not
+    submitted and its result is None.
+    """
+
+    name: str
+    submit: Callable[[dict[str, Any]], Submitted]
+    needs: list[str] = field(default_factory=list)
+    critical: bool = True
+    done: Optional[Callable[[], bool]] = None
+
+
+@dataclass
+class StageTiming:
+    """
+    seconds since the graph started
+    """
+
+    started_at: float
+    finished_at: float
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class StageReport:
+    timings: dict[str, StageTiming]
+    critical_path: list[str]
+    slack: dict[str, float]
+    errors: dict[str, BaseException]
+    skipped: list[str]
+    reused: list[str]
+
+    @property
+    def total_seconds(self) -> float:
+        return max((t.finished_at for t in self.timings.values()), default=0.0)
+
+    def format(self) -> str:
+        lines = [
+            f"total {self.total_seconds:.1f}s, critical path: "
+            + " -> ".join(
+                f"{name} ({self.timings[name].duration:.1f}s)"
+                for name in self.critical_path
+            )
+        ]
+        by_start = sorted(self.timings.items(), key=lambda x: x[1].started_at)
+        for name, timing in by_start:
+            status = " failed" if name in self.errors else ""
+            if name in self.reused:
+                status = " (checkpoint)"
+            lines.append(
+                f"  {name}: start {timing.started_at:.1f}s,"
+                f" took {timing.duration:.1f}s, slack {self.slack[name]:.1f}s{status}"
+            )
+        for name in self.skipped:
+            lines.append(f"  {name}: skipped")
+        return "\n".join(lines)
+
+
+class StageGraph:
+    """
+    runs every stage as soon as all the stages it needs have succeeded,
+    instead of in fixed phases
+    """
+
+    def __init__(self, stages: list[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            for need in stage.needs:
+                if need not in self.stages:
+                    raise ValueError(f"Stage {stage.name} needs unknown stage {need}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> list[str]:
+        order: list[str] = []
+        visiting: set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            visiting.add(name)
+            for need in self.stages[name].needs:
+                visit(need)
+            visiting.remove(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def run(self) -> StageReport:
+        """
+        raises the error of the first critical stage that fails
+        """
+        origin = time.monotonic()
+        events: queue.Queue = queue.Queue()
+        results: dict[str, Any] = {}
+        timings: dict[str, StageTiming] = {}
+        errors: dict[str, BaseException] = {}
+        waiting = list(self.order)
+        reused: list[str] = []
+        # name -> (started at, futures, number still running)
+        running: dict[str, tuple[float, list, int]] = {}
+
+        def finish(name: str, started_at: float) -> None:
+            timings[name] = StageTiming(started_at, time.monotonic() - origin)
+
+        def start_ready() -> None:
+            # stages that submit nothing finish at once and may unblock others
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in list(waiting):
+                    stage = self.stages[name]
+                    if not all(need in results for need in stage.needs):
+                        continue
+                    waiting.remove(name)
+                    started_at = time.monotonic() - origin
+                    if stage.done and stage.done():
+                        reused.append(name)
+                        futures = None
+                    else:
+                        needed = {need: results[need] for need in stage.needs}
+                        futures = stage.submit(needed)
+                    if not futures:
+                        results[name] = None
+                        finish(name, started_at)
+                        progressed = True
+                        continue
+                    if not isinstance(futures, list):
+                        futures = [futures]
+                    running[name] = (started_at, futures, len(futures))
+                    for future in futures:
+                        future.add_done_callback(lambda _, name=name: events.put(name))
+
+        start_ready()
+        while running:
+            name = events.get()
+            started_at, futures, remaining = running[name]
+            if remaining > 1:
+                running[name] = (started_at, futures, remaining - 1)
+                continue
+            del running[name]
+            finish(name, started_at)
+            try:
+                values = [future.result() for future in futures]
+            except Exception as e:
+                if self.stages[name].critical:
+                    raise
+                errors[name] = e
+                continue
+            results[name] = values[0] if len(values) == 1 else values
+            start_ready()
+
+        critical_path, slack = self._analyze(timings)
+        return StageReport(
+            timings=timings,
+            critical_path=critical_path,
+            slack=slack,
+            errors=errors,
+            skipped=waiting,
+            reused=reused,
+        )
+
+    def _analyze(
+        self, timings: dict[str, StageTiming]
+    ) -> tuple[list[str], dict[str, float]]:
+        """
+        the critical path follows, from the stage that finished last, the need
+        that finished last. slack is how much later a stage could have finished
+        without delaying the end of the run.
+        """
+        if not timings:
+            return [], {}
+        total = max(t.finished_at for t in timings.values())
+
+        latest_finish: dict[str, float] = {}
+        for name in reversed(self.order):
+            if name not in timings:
+                continue
+            dependents = [
+                other
+                for other in timings
+                if name in self.stages[other].needs and other in latest_finish
+            ]
+            latest_finish[name] = min(
+                (
+                    latest_finish[other] - timings[other].duration
+                    for other in dependents
+                ),
+                default=total,
+            )
+        slack = {
+            name: max(0.0, latest_finish[name] - timing.finished_at)
+            for name, timing in timings.items()
+        }
+
+        path: list[str] = []
+        current: Optional[str] = max(timings, key=lambda n: timings[n].finished_at)
+        while current:
+            path.append(current)
+            needs = [need for need in self.stages[current].needs if need in timings]
+            current = max(needs, key=lambda n: timings[n].finished_at, default=None)
+        path.reverse()
+        return path, slack
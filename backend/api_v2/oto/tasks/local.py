@@ -0,0 +1,109 @@
+import contextvars
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from oto.environment import get_settings
+from oto.domain.job import PrefectJobStatus
+from oto.tasks.conversation.task import run_conversation_stages
+
+LOCAL_RUN_PREFIX = "local-"
+
+
+@lru_cache
+def get_local_pipeline_executor() -> "LocalPipelineExecutor":
+    settings = get_settings()
+    return LocalPipelineExecutor(
+        max_conversations=settings.local_pipeline_conversations,
+        max_tasks=settings.local_pipeline_workers,
+    )
+
+
+class LocalRun:
+    def __init__(self, run_id: str, conversation_id: str):
+        self.id = run_id
+        self.conversation_id = conversation_id
+        self.future: Future = Future()
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+
+    @property
+    def status(self) -> str:
+        # named like prefect states, so clients see the same values
+        if not self.future.done():
+            return "Running" if self.started_at else "Pending"
+        if self.future.cancelled() or self.future.exception():
+            return "Failed"
+        return "Completed"
+
+
+class LocalPipelineExecutor:
+    """
+    runs the conversation pipeline in this process, without a prefect server.
+    the same task functions run in the same stage graph, on a thread pool, so
+    stages still share the conversation context of their run. finished runs
+    are kept for status lookups, only the most recent ones.
+    """
+
+    MAX_FINISHED_RUNS = 1000
+
+    def __init__(self, max_conversations: int, max_tasks: int):
+        self.run_pool = ThreadPoolExecutor(
+            max_conversations, thread_name_prefix="oto-run"
+        )
+        # separate from the runs, which block on their tasks
+        self.task_pool = ThreadPoolExecutor(max_tasks, thread_name_prefix="oto-task")
+        self.runs: dict[str, LocalRun] = {}
+        # finished runs, oldest first
+        self.finished: OrderedDict[str, LocalRun] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit_task(self, task, *args) -> Future:
+        # carry the caller's usage attribution into the pool
+        return self.task_pool.submit(contextvars.copy_context().run, task.fn, *args)
+
+    def process_conversation(
+        self, conversation_id: str, resume: bool = False
+    ) -> LocalRun:
+        run_id = f"{LOCAL_RUN_PREFIX}{uuid.uuid4()}"
+
+        local_run = LocalRun(run_id, conversation_id)
+
+        def run() -> None:
+            local_run.started_at = datetime.now()
+            run_conversation_stages(conversation_id, resume, self.submit_task)
+
+        with self._lock:
+            self.runs[run_id] = local_run
+        local_run.future = self.run_pool.submit(run)
+        local_run.future.add_done_callback(lambda _: self._finish(local_run))
+        return local_run
+
+    def _finish(self, local_run: LocalRun) -> None:
+        with self._lock:
+            self.runs.pop(local_run.id, None)
+            self.finished[local_run.id] = local_run
+            while len(self.finished) > self.MAX_FINISHED_RUNS:
+                self.finished.popitem(last=False)
+
+    def get_status(self, run_id: str) -> Optional[PrefectJobStatus]:
+        """
+        None when the run is unknown, e.g. it was started before a restart
+        or finished long ago
+        """
+        with self._lock:
+            run = self.runs.get(run_id) or self.finished.get(run_id)
+        if not run:
+            return None
+        return PrefectJobStatus(
+            status=run.status,
+            started_at=run.started_at,
+            estimated_run_time_in_seconds=(
+                (datetime.now() - run.started_at).total_seconds()
+                if run.started_at
+                else -1
+            ),
+        )
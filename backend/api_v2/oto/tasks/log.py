@@ -0,0 +1,13 @@
+import logging
+from prefect import get_run_logger
+from prefect.exceptions import MissingContextError
+
+
+def get_logger():
+    """
+    the prefect run logger, or a plain logger when the task runs without prefect
+    """
+    try:
+        return get_run_logger()
+    except MissingContextError:
+        return logging.getLogger("oto.tasks")